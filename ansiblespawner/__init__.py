@@ -1,4 +1,14 @@
 from ._version import version as __version__
 from .ansiblespawner import AnsibleSpawner, AnsibleException
+from .executor import Executor, LocalExecutor, RemoteExecutor
+from .placement import PlacementError
 
-__all__ = ["__version__", "AnsibleSpawner", "AnsibleException"]
+__all__ = [
+    "__version__",
+    "AnsibleSpawner",
+    "AnsibleException",
+    "Executor",
+    "LocalExecutor",
+    "RemoteExecutor",
+    "PlacementError",
+]
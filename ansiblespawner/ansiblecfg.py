@@ -0,0 +1,225 @@
+"""
+Generate an ansible.cfg tuned for spawner runs
+"""
+
+import configparser
+import io
+import json
+import logging
+import os
+import stat
+import threading
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    Optional as OptionalT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+_rendered: DictT[str, OptionalT[str]] = {}
+_rendered_lock = threading.Lock()
+
+# Named execution profiles
+PROFILES: DictT[str, JsonT] = {
+    "default": {},
+    # Fewer round trips per task and no implicit fact gathering
+    "fast": {
+        "pipelining": True,
+        "ssh_args": "-o ControlMaster=auto -o ControlPersist=60s",
+        "strategy": "free",
+        "forks": 20,
+        "gathering": "explicit",
+    },
+    # As fast, with mitogen if it's installed
+    "mitogen": {
+        "pipelining": True,
+        "ssh_args": "-o ControlMaster=auto -o ControlPersist=60s",
+        "strategy": "mitogen_free",
+        "forks": 20,
+        "gathering": "explicit",
+    },
+}
+
+
+# Options that Ansible resolves relative to the configuration file, in addition
+# to those ending in _path, _paths or _plugins
+PATH_OPTIONS = {
+    "control_path_dir",
+    "fact_caching_connection",
+    "inventory",
+    "library",
+    "local_tmp",
+    "module_utils",
+    "private_key_file",
+    "vault_password_file",
+}
+
+
+def find_ansible_cfg() -> OptionalT[str]:
+    """
+    The ansible.cfg Ansible would use if none was generated, following its
+    search order: ANSIBLE_CONFIG, ansible.cfg in the current directory (unless
+    the directory is world writable), ~/.ansible.cfg, /etc/ansible/ansible.cfg
+    """
+    path = os.environ.get("ANSIBLE_CONFIG")
+    if path:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "ansible.cfg")
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    cwd = os.getcwd()
+    if not os.stat(cwd).st_mode & stat.S_IWOTH:
+        path = os.path.join(cwd, "ansible.cfg")
+        if os.path.isfile(path):
+            return path
+    for path in (os.path.expanduser("~/.ansible.cfg"), "/etc/ansible/ansible.cfg"):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _is_path_option(name: str) -> bool:
+    if name == "control_path":
+        # A format string, not a path
+        return False
+    return name in PATH_OPTIONS or name.endswith(("_path", "_paths", "_plugins"))
+
+
+def _absolute_paths(value: str, separator: str, basedir: str) -> str:
+    paths = []
+    for path in value.split(separator):
+        path = path.strip()
+        if path and not (
+            os.path.isabs(path) or path.startswith(("~", "$")) or "%" in path
+        ):
+            path = os.path.normpath(os.path.join(basedir, path))
+        paths.append(path)
+    return separator.join(paths)
+
+
+def _read_base_config(cfg: configparser.ConfigParser, path: str) -> None:
+    """
+    Read an ansible.cfg, converting relative paths to absolute paths so they
+    still refer to the same location when the config is copied
+    """
+    with open(path) as f:
+        cfg.read_file(f)
+    basedir = os.path.dirname(os.path.abspath(path))
+    for section in cfg.sections():
+        for name, value in cfg[section].items():
+            if _is_path_option(name):
+                separator = "," if name == "inventory" else os.pathsep
+                cfg[section][name] = _absolute_paths(value, separator, basedir)
+
+
+def _mitogen_strategy_plugins() -> OptionalT[str]:
+    try:
+        import ansible_mitogen
+    except ImportError:
+        return None
+    return os.path.join(
+        os.path.dirname(ansible_mitogen.__file__), "plugins", "strategy"
+    )
+
+
+def get_profile(profile: AnyT) -> JsonT:
+    """
+    Convert a profile name or dictionary to a dictionary
+    """
+    if isinstance(profile, str):
+        try:
+            return PROFILES[profile]
+        except KeyError:
+            raise ValueError(f"Unknown execution profile {profile}")
+    return profile or {}
+
+
+def render_ansible_cfg(profile: AnyT) -> OptionalT[str]:
+    """
+    Render an ansible.cfg for an execution profile, or None if the profile is
+    empty.
+
+    profile: A name from PROFILES or a dictionary with optional fields:
+      - base_config: path to an existing ansible.cfg to start from, default is
+        the file found by find_ansible_cfg(), None or "" to not use one.
+        Relative paths in the file are made absolute.
+      - pipelining: bool
+      - ssh_args: SSH arguments, e.g. for connection reuse
+      - strategy: strategy plugin, e.g. "linear", "free", "mitogen_linear".
+        Mitogen strategies fall back to the equivalent builtin strategy if
+        mitogen isn't installed
+      - forks: int
+      - gathering: "implicit", "explicit" or "smart"
+      - callbacks_enabled: list of callback plugins to enable
+      - options: dictionary of section to a dictionary of other options
+    """
+    profile = get_profile(profile)
+    if not profile:
+        return None
+
+    cfg = configparser.ConfigParser(interpolation=None)
+    base_config = profile.get("base_config", find_ansible_cfg())
+    if base_config:
+        _read_base_config(cfg, base_config)
+    for section in ("defaults", "ssh_connection", "connection"):
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+
+    if "pipelining" in profile:
+        pipelining = str(bool(profile["pipelining"]))
+        cfg["ssh_connection"]["pipelining"] = pipelining
+        cfg["connection"]["pipelining"] = pipelining
+    if profile.get("ssh_args"):
+        cfg["ssh_connection"]["ssh_args"] = profile["ssh_args"]
+    if profile.get("forks"):
+        cfg["defaults"]["forks"] = str(profile["forks"])
+    if profile.get("gathering"):
+        cfg["defaults"]["gathering"] = profile["gathering"]
+    if profile.get("callbacks_enabled"):
+        callbacks = ",".join(profile["callbacks_enabled"])
+        cfg["defaults"]["callbacks_enabled"] = callbacks
+        # Name used before Ansible 2.11
+        cfg["defaults"]["callback_whitelist"] = callbacks
+
+    strategy = profile.get("strategy")
+    if strategy and strategy.startswith("mitogen_"):
+        plugins = _mitogen_strategy_plugins()
+        if plugins:
+            cfg["defaults"]["strategy_plugins"] = plugins
+        else:
+            fallback = strategy.replace("mitogen_", "", 1)
+            logger.warning(
+                "mitogen is not installed, using strategy %s instead of %s",
+                fallback,
+                strategy,
+            )
+            strategy = fallback
+    if strategy:
+        cfg["defaults"]["strategy"] = strategy
+
+    for section, options in profile.get("options", {}).items():
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+        for k, v in options.items():
+            cfg[section][k] = str(v)
+
+    out = io.StringIO()
+    cfg.write(out)
+    return out.getvalue()
+
+
+def get_ansible_cfg(profile: AnyT) -> OptionalT[str]:
+    """
+    render_ansible_cfg, cached for the life of the process so the base config
+    is read and mitogen is looked for once per profile
+    """
+    key = json.dumps(profile, sort_keys=True)
+    with _rendered_lock:
+        if key not in _rendered:
+            _rendered[key] = render_ansible_cfg(profile)
+        return _rendered[key]
@@ -7,19 +7,52 @@ import asyncio
 from datetime import datetime
 from functools import partial
 from jinja2 import Template
+import json
+from jupyterhub import orm
+from jupyterhub.app import JupyterHub
 from jupyterhub.spawner import Spawner
 from jupyterhub.traitlets import Callable
 import logging
 import os
 from re import sub as re_sub
+from sqlalchemy.orm import object_session
 import tempfile
-from traitlets import Bool, Dict, Instance, Unicode, Union
+import time
+from traitlets import (
+    Bool,
+    Dict,
+    Enum,
+    Float,
+    Instance,
+    Integer,
+    List,
+    Type,
+    TraitError,
+    Unicode,
+    Union,
+    default,
+    validate,
+)
+
+from .ansiblecfg import PROFILES, get_ansible_cfg
+from .artifacts import KEEP, get_artifact_store
+from .batch import get_batcher
+from .dag import PlaybookDag, merge_outputs
+from .durations import SpawnProgress, get_duration_store
+from .eventlog import get_event_log_writer
+from .executor import Executor, LocalExecutor, RunResult
+from .expiry import cancel_expiry, schedule_expiry
+from .lifecycle import Lifecycle
+from .placement import POLICIES, get_host_pool
+from .ratelimit import THROTTLE_PATTERNS, get_rate_limiter, is_throttled
 
 from typing import (
     Any as AnyT,
     AsyncGenerator as AsyncGeneratorT,
     Dict as DictT,
     List as ListT,
+    Optional as OptionalT,
+    Set as SetT,
     Tuple as TupleT,
     Union as UnionT,
 )
@@ -28,9 +61,31 @@ JsonT = DictT[str, AnyT]
 
 logger = logging.getLogger(__name__)
 
+# Hubs whose stopped servers have been loaded, see _load_stopped_servers
+_loaded_hubs: SetT[int] = set()
+
+# Inventory group containing one host per user in a batched create
+BATCH_GROUP = "ansiblespawner_batch"
+
+
+def _get_ansiblespawner_out(events: ListT[JsonT]) -> JsonT:
+    """
+    Merge the "ansiblespawner_out" facts set in a list of Ansible events
+    """
+    ansiblespawner_out = {}
+    for e in events:
+        if e["event"] == "runner_on_ok":
+            try:
+                ansiblespawner_out.update(
+                    e["event_data"]["res"]["ansible_facts"]["ansiblespawner_out"]
+                )
+            except KeyError:
+                continue
+    return ansiblespawner_out
+
 
 class AnsibleException(Exception):
-    def __init__(self, message: str, runner: ansible_runner.Runner):
+    def __init__(self, message: str, runner: UnionT[ansible_runner.Runner, RunResult]):
         super().__init__(message)
         self.rc = runner.rc
         self.status = runner.status
@@ -73,10 +128,11 @@ class AnsibleSpawner(Spawner):
         """,
     )
 
-    create_playbook = Unicode(
+    create_playbook = Union(
+        [Unicode(), Dict()],
         config=True,
         help="""
-        Playbook to create a singleuser server.
+        Playbook to create a singleuser server, or a graph of playbooks.
 
         Typically this will target "localhost".
         The following variables will be passed to this playbook:
@@ -92,14 +148,80 @@ class AnsibleSpawner(Spawner):
         If these fields are not set the update_playbook must set them.
 
         The contents of "ansiblespawner_out" will be saved as state.
+
+        A graph is a dictionary of node names to a playbook or a dictionary
+        with the fields "playbook" and "depends", a list of node names:
+
+            {
+                "volume": "volume.yml",
+                "secgroup": "secgroup.yml",
+                "instance": {
+                    "playbook": "instance.yml",
+                    "depends": ["volume", "secgroup"],
+                },
+            }
+
+        Each playbook is run as soon as its dependencies have succeeded, so
+        independent playbooks run concurrently. In addition to the above
+        variables each playbook is passed "dependency_out", a dictionary of
+        the "ansiblespawner_out" of its direct dependencies, which are also
+        shallow merged into the "serverinfo" passed to the playbook and used to
+        render its inventory.
+        The "ansiblespawner_out" of all playbooks are shallow merged in
+        dependency order, with nodes that have no dependency between them
+        merged in the order they are declared, later playbooks having a higher
+        priority. If a playbook fails no further playbooks are started.
+        """,
+    )
+
+    start_batch_window = Float(
+        0,
+        config=True,
+        help="""
+        Seconds to wait for other users' starts so their create_playbook runs
+        can be combined into a single Ansible run. 0 disables batching.
+        Batching is not used if create_playbook is a graph.
+
+        When batching is enabled the create_playbook is run with an inventory
+        containing a group "ansiblespawner_batch" with one host per user, with
+        a local connection. The variables normally passed to create_playbook
+        are host variables instead of extra variables, and the inventory
+        option is not used for create_playbook.
+        The playbook must target "ansiblespawner_batch", for example:
+
+            - hosts: ansiblespawner_batch
+              gather_facts: false
+              tasks: ...
+
+        Each user's "ansiblespawner_out" is taken from the facts set on their
+        host, and a failure on one host only fails that user's start.
+        """,
+    )
+
+    start_batch_max_size = Integer(
+        50,
+        config=True,
+        help="""
+        Maximum number of starts in a batch, a batch is run as soon as it is full.
+        """,
+    )
+
+    start_batch_max_forks = Integer(
+        50,
+        config=True,
+        help="""
+        Maximum number of Ansible forks for a batch, the number of forks is the
+        smaller of this and the batch size.
         """,
     )
 
-    update_playbook = Unicode(
+    update_playbook = Union(
+        [Unicode(), Dict()],
         allow_none=True,
         config=True,
         help="""
-        Playbook to update a singleuser server after creation.
+        Playbook to update a singleuser server after creation, or a graph of
+        playbooks (see create_playbook).
 
         Typically this will target the singleuser server.
           - command
@@ -151,6 +273,72 @@ class AnsibleSpawner(Spawner):
         """,
     )
 
+    suspend_playbook = Unicode(
+        None,
+        allow_none=True,
+        config=True,
+        help="""
+        Optional playbook to suspend a singleuser server instead of destroying it,
+        for example by stopping a VM or pausing a container.
+        Requires resume_playbook.
+
+        If set every stop by JupyterHub, including idle culling and deleting
+        the server, runs this playbook and keeps serverinfo. JupyterHub never
+        calls stop(now=True), so destroy_playbook is only run when
+        suspended_lifetime expires or a resume fails.
+
+        Typically this will target "localhost".
+        The following variables will be passed to this playbook:
+          - command
+          - playbook_vars
+          - serverinfo: Output from the create and update playbooks
+          - spawner_environment
+          - user
+
+        The playbook may set a fact "ansiblespawner_out", which will be shallow
+        merged into serverinfo.
+        """,
+    )
+
+    resume_playbook = Unicode(
+        None,
+        allow_none=True,
+        config=True,
+        help="""
+        Optional playbook to resume a server suspended by suspend_playbook.
+        This is run by start() instead of create_playbook, followed by the
+        update_playbook.
+
+        The following variables will be passed to this playbook:
+          - command
+          - playbook_vars
+          - serverinfo: Output from the create, update and suspend playbooks
+          - spawner_environment
+          - user
+
+        The playbook may set a fact "ansiblespawner_out", which will be shallow
+        merged into serverinfo, for example to update "ip" if it changed.
+        If this playbook fails the server is destroyed and created again.
+        """,
+    )
+
+    suspended_lifetime = Integer(
+        7 * 24 * 3600,
+        config=True,
+        help="""
+        Seconds a suspended server is kept before destroy_playbook is run,
+        default 7 days. JupyterHub never calls stop(now=True) so this is how
+        suspended servers of users who don't return are destroyed.
+        0 means suspended servers are kept until the user starts again.
+
+        Expired servers are destroyed by a timer in the hub. After the hub
+        restarts the timers are scheduled when the first AnsibleSpawner is
+        loaded: at startup if any server is running, otherwise when a user
+        first uses the hub. Servers that expire while the hub is stopped are
+        destroyed then.
+        """,
+    )
+
     playbook_vars = Union(
         [Dict(), Callable()],
         allow_none=True,
@@ -170,8 +358,328 @@ class AnsibleSpawner(Spawner):
         """,
     )
 
+    artifact_dir = Unicode(
+        None,
+        allow_none=True,
+        config=True,
+        help="""
+        Directory for archived Ansible run directories.
+
+        If set each run directory is compressed into
+        "<artifact_dir>/<escaped_name>[-<server_name>]/<time>-<operation>-<result>-*.tar.gz"
+        by a background thread and then deleted, and recorded in
+        "<artifact_dir>/index.json" so recent runs can be found without listing
+        the directories. Batched create runs are archived under
+        "ansiblespawner_batch" since they include every user's variables.
+        This takes precedence over keep_temp_dirs.
+        """,
+    )
+
+    artifact_keep = Enum(
+        list(KEEP),
+        default_value="all",
+        config=True,
+        help="""
+        Which runs to archive in artifact_dir: "all", or only "failed" runs.
+        Other runs are only recorded in the index.
+        """,
+    )
+
+    artifact_max_bytes = Integer(
+        1024 * 1024 * 1024,
+        config=True,
+        help="""
+        Maximum total size of the archives in artifact_dir, 0 for no limit.
+        The oldest archives are deleted first.
+        """,
+    )
+
+    artifact_max_age = Float(
+        7 * 24 * 3600,
+        config=True,
+        help="""
+        Runs older than this many seconds are deleted from artifact_dir,
+        0 for no limit.
+        """,
+    )
+
+    rate_limits = Dict(
+        config=True,
+        help="""
+        Token-bucket rate limits shared by all spawners in the hub, as a
+        dictionary of budget name to parameters, for example one budget per
+        cloud API:
+
+            {"ec2": {"rate": 2, "burst": 10}}
+
+        Parameters:
+          - rate: maximum tokens per second
+          - burst: maximum tokens that can be used at once
+          - min_rate: minimum rate after throttling, default rate / 10
+          - increase: rate added after each run that isn't throttled, default
+            rate / 10
+          - decrease: factor applied to the rate after throttling, default 0.5
+
+        Ansible runs wait until their costs (rate_limit_costs) are available.
+        If a run's failure or retry output matches rate_limit_throttle_patterns
+        the rate of its budgets is reduced, and it recovers gradually after
+        runs that aren't throttled.
+        """,
+    )
+
+    rate_limit_costs = Dict(
+        config=True,
+        help="""
+        Tokens used by each operation, as a dictionary of operation to a
+        dictionary of budget name to tokens, for example:
+
+            {
+                "create": {"ec2": 5},
+                "poll": {"ec2": 1},
+                "destroy": {"ec2": 2},
+            }
+
+        Operations are "create", "update", "poll", "suspend", "resume" and
+        "destroy". Batched creates are "create-batch" and playbooks in a graph
+        are "<operation>-<node>", if these aren't set the cost of the base
+        operation is used. Operations that aren't listed aren't limited.
+
+        Costs are per server: a batched create takes the "create-batch" (or
+        "create") cost multiplied by the number of users in the batch. Costs
+        larger than a budget's burst are taken as its tokens are added.
+        """,
+    )
+
+    rate_limit_throttle_patterns = List(
+        Unicode(),
+        default_value=THROTTLE_PATTERNS,
+        config=True,
+        help="""
+        Regular expressions that indicate an Ansible failure or retry was
+        caused by cloud API throttling.
+        """,
+    )
+
+    execution_profile = Union(
+        [Enum(list(PROFILES)), Dict()],
+        default_value="default",
+        config=True,
+        help="""
+        Ansible configuration written to an ansible.cfg in each run's
+        private_data_dir and used instead of the ansible.cfg Ansible would
+        otherwise find (ANSIBLE_CONFIG, ansible.cfg in the current directory,
+        ~/.ansible.cfg or /etc/ansible/ansible.cfg). That file is used as the
+        base of the generated configuration unless base_config is set.
+
+        Either the name of a built-in profile:
+          - "default": don't write an ansible.cfg
+          - "fast": SSH pipelining and connection reuse, the free strategy,
+            20 forks and explicit fact gathering
+          - "mitogen": as "fast" using the mitogen_free strategy if mitogen is
+            installed, otherwise the free strategy
+        or a dictionary with optional keys:
+          - base_config: path to an existing ansible.cfg to extend, or None to
+            not extend one. Relative paths in it, e.g. "./collections" in the
+            aws-ec2 example, are made absolute against its directory.
+          - pipelining: bool
+          - ssh_args: SSH connection arguments
+          - strategy: strategy plugin, e.g. "linear", "free", "mitogen_linear"
+          - forks: int
+          - gathering: "implicit", "explicit" or "smart"
+          - callbacks_enabled: list of callback plugins to enable
+          - options: dictionary of section to a dictionary of other options
+
+        The configuration is generated once, the hub must be restarted to pick
+        up changes to the base ansible.cfg.
+
+        With explicit gathering plays that use facts must set
+        `gather_facts: true`.
+        """,
+    )
+
+    event_log_dir = Unicode(
+        None,
+        allow_none=True,
+        config=True,
+        help="""
+        Directory for structured Ansible event logs.
+
+        If set every Ansible event is appended as a JSON line to a per-user file
+        "<escaped_name>.jsonl" (or "<escaped_name>-<server_name>.jsonl" for named
+        servers) by a background thread shared by all spawners. Batched create
+        runs (see start_batch_window) are written to "ansiblespawner_batch.jsonl"
+        since they include every user in the batch.
+        If None no event log is written.
+        """,
+    )
+
+    event_log_max_bytes = Integer(
+        10 * 1024 * 1024,
+        config=True,
+        help="""
+        Rotate an event log file when it would exceed this size in bytes.
+        0 disables rotation.
+        """,
+    )
+
+    event_log_backup_count = Integer(
+        5,
+        config=True,
+        help="""
+        Number of rotated event log files to keep for each user.
+        """,
+    )
+
+    duration_store_path = Unicode(
+        None,
+        allow_none=True,
+        config=True,
+        help="""
+        JSON file used to record how long each start phase and task takes.
+
+        If set the recorded durations are used to report progress percentages
+        and the estimated time remaining when starting, and to warn about
+        starts that are much slower than usual.
+        If None durations are not recorded.
+        """,
+    )
+
+    duration_min_samples = Integer(
+        3,
+        config=True,
+        help="""
+        Number of recorded starts required before progress is estimated.
+        """,
+    )
+
+    slow_start_factor = Float(
+        2.0,
+        config=True,
+        help="""
+        Warn if a start phase takes more than this multiple of its usual duration.
+        """,
+    )
+
+    placement_hosts = Dict(
+        config=True,
+        help="""
+        Pool of hosts that servers are placed on.
+        Dictionary of host name to a dictionary with optional fields:
+          - capacity: dictionary of resource name to amount,
+            e.g. {"cpu": 16, "memory": 65536, "users": 50}
+          - vars: dictionary of variables for this host
+
+        If set each start is assigned a host with enough free capacity for
+        placement_request, and a variable "placement" is passed to all
+        playbooks and the inventory:
+          - host: the host name
+          - resources: the requested resources
+          - vars: the host's vars
+        The placement is saved in serverinfo["placement"].
+        Capacity is released when the server is destroyed, suspended servers
+        and incomplete starts keep their host. After the hub restarts the
+        placements of all servers are restored from their state before the
+        first server is placed.
+
+        If empty placement is disabled.
+        """,
+    )
+
+    placement_policy = Enum(
+        POLICIES,
+        default_value="best-fit",
+        config=True,
+        help="""
+        How a host is chosen from placement_hosts:
+          - best-fit: pack servers onto as few hosts as possible
+          - first-fit: the first host with enough capacity
+          - spread: the host with the most free capacity
+        """,
+    )
+
+    placement_request = Union(
+        [Dict(), Callable()],
+        config=True,
+        help="""
+        Resources required by each server as a dictionary of resource name to
+        amount, or a callable that returns the dictionary.
+        Resources that are not in a host's capacity are not limited.
+        """,
+    )
+
+    resumable_start = Bool(
+        False,
+        config=True,
+        help="""
+        Save a checkpoint in the spawner state after each start phase
+        (create_playbook, update_playbook) so a failed or interrupted start can
+        be resumed.
+
+        The checkpoint is written to the database as soon as a phase completes.
+        If a start fails, or the hub restarts, before all phases complete the
+        server is reported as not running and is not destroyed. The next start
+        runs the poll_playbook against the saved output and if the server is
+        running resumes from the first incomplete phase, otherwise it runs the
+        destroy_playbook to delete anything the incomplete start created,
+        discards the checkpoint and starts from create_playbook.
+
+        JupyterHub doesn't call stop() for a server that failed to start, so
+        resources created by an incomplete start are kept until the user starts
+        again or the checkpoint is older than checkpoint_lifetime.
+        """,
+    )
+
+    checkpoint_lifetime = Integer(
+        24 * 3600,
+        config=True,
+        help="""
+        Seconds the checkpoint of an incomplete start is kept before
+        destroy_playbook is run to delete the resources it created.
+        0 means checkpoints are kept until the user starts again.
+
+        Expired checkpoints are destroyed by a timer in the hub. After the hub
+        restarts the timers are scheduled when the first AnsibleSpawner is
+        loaded, as for suspended_lifetime.
+        """,
+    )
+
+    executor_class = Type(
+        LocalExecutor,
+        klass=Executor,
+        config=True,
+        help="""
+        Class used to run Ansible.
+
+        LocalExecutor runs Ansible in the JupyterHub process.
+        RemoteExecutor sends each run to a remote worker
+        (`python -m ansiblespawner.worker`), configure it with
+        `c.RemoteExecutor.workers` and `c.RemoteExecutor.secret`.
+        """,
+    )
+
     # Non-config properties
 
+    executor = Instance(
+        Executor,
+        help="""
+        The executor instance, created from executor_class
+        """,
+    )
+
+    @default("executor")
+    def _default_executor(self) -> Executor:
+        return self.executor_class(parent=self, log=self.log)
+
+    lifecycle = Instance(
+        Lifecycle,
+        args=(),
+        help="""
+        Lifecycle state of the server (idle, creating, updating, running,
+        stopping). Concurrent calls to start(), poll() or stop() share the run
+        in flight, and different operations are run one at a time.
+        """,
+    )
+
     events = Instance(
         asyncio.Queue,
         args=(),
@@ -188,39 +696,62 @@ class AnsibleSpawner(Spawner):
         """,
     )
 
+    placement = Dict(
+        allow_none=True,
+        help="""
+        The host this server is placed on, see placement_hosts
+        """,
+    )
+
+    suspended_at = Float(
+        None,
+        allow_none=True,
+        help="""
+        Unix time when the server was suspended, None if it is not suspended
+        """,
+    )
+
+    checkpoint = Dict(
+        allow_none=True,
+        help="""
+        Progress of an incomplete start, only used if resumable_start is set.
+        "phases": list of completed phases, "outputs": dictionary of the
+        ansiblespawner_out of each completed phase, "time": when it was last
+        updated.
+        """,
+    )
+
     async def ansible_async(
         self, loop: asyncio.AbstractEventLoop, **kwargs
-    ) -> ansible_runner.Runner:
+    ) -> UnionT[ansible_runner.Runner, RunResult]:
         """
-        Wrap ansible_runner.run_async so it can be used with asyncio
+        Wrap ansible_runner.run_async so it can be used with asyncio, running
+        it with the configured executor
         loop: The event loop
         *kwargs: Keyword arguments for ansible_runner.run_async
         """
-        # https://docs.python.org/3.6/library/asyncio-task.html#example-future-with-run-until-complete
-
-        # Ansible runs in a different thread from asyncio so must use
-        # call_soon_threadsafe
-        # https://docs.python.org/3.6/library/asyncio-dev.html#concurrency-and-multithreading
-
-        future = loop.create_future()
-
-        def finished_callback(runner: ansible_runner.Runner):
-            self.log.debug(f"finished_callback: {runner}")
-            loop.call_soon_threadsafe(future.set_result, runner)
-
-        t, r = ansible_runner.run_async(finished_callback=finished_callback, **kwargs)
-
-        result = await future
-        # Shouldn't block since future should only return when ansible has finished
-        t.join()
-        return result
+        return await self.executor.run(loop, **kwargs)
 
     async def run_ansible(
         self,
         loop: asyncio.AbstractEventLoop,
         inventory: UnionT[JsonT, TupleT[str, str]],
+        operation: OptionalT[str] = None,
+        key: OptionalT[str] = None,
+        servers: int = 1,
         **kwargs,
     ) -> JsonT:
+        """
+        Run an Ansible playbook
+        loop: The event loop
+        inventory: Inventory dictionary or a tuple of (filename, content)
+        operation: Name of the spawner operation, used to label logged events
+        key: Key for the event log and archived run directory, default is this
+          spawner's server key
+        servers: Number of servers the run is for, the rate limit costs are
+          multiplied by this
+        *kwargs: Keyword arguments for ansible_runner.run_async
+        """
         ansible_kwargs: JsonT = dict(
             quiet=True,
         )
@@ -246,21 +777,26 @@ class AnsibleSpawner(Spawner):
 
         ansible_kwargs.update(kwargs)
 
-        def log_event_handler(e: JsonT) -> bool:
-            self.log.debug(e["event"] + (("\n" + e["stdout"]) if "stdout" in e else ""))
-            # Needs to return True otherwise the event is discarded
-            # https://github.com/ansible/ansible-runner/blob/1.4.6/ansible_runner/runner.py#L69
-            return True
+        ansible_cfg = get_ansible_cfg(self.execution_profile)
+        if ansible_cfg:
+            ansible_cfg_file = os.path.join(private_data_dir, "ansible.cfg")
+            with open(ansible_cfg_file, "w") as f:
+                f.write(ansible_cfg)
+            envvars = dict(ansible_kwargs.get("envvars") or {})
+            envvars["ANSIBLE_CONFIG"] = ansible_cfg_file
+            ansible_kwargs["envvars"] = envvars
 
+        log_event_handler = self._get_log_event_handler(operation, key)
         if "event_handler" in ansible_kwargs:
             event_handler = ansible_kwargs["event_handler"]
 
             def user_event_handler(e: JsonT, finished=False) -> bool:
-                log_event_handler(e)
+                if log_event_handler:
+                    log_event_handler(e)
                 return event_handler(e)
 
             ansible_kwargs["event_handler"] = user_event_handler
-        else:
+        elif log_event_handler:
             ansible_kwargs["event_handler"] = log_event_handler
 
         def status_handler(
@@ -271,34 +807,43 @@ class AnsibleSpawner(Spawner):
 
         ansible_kwargs["status_handler"] = status_handler
 
-        self.log.debug(f"ansible_kwargs: {ansible_kwargs}")
+        costs = self._get_rate_limit_costs(operation, servers)
+        limiter = None
+        if costs:
+            limiter = self._get_rate_limiter()
+            waited = await limiter.acquire(costs)
+            if waited:
+                self.log.info("Rate limited %s for %.1fs", operation, waited)
+
+        self.log.debug("ansible_kwargs: %s", ansible_kwargs)
         r = await self.ansible_async(loop, **ansible_kwargs)
 
-        self.log.debug(f"{r.stats}")
+        self.log.debug("%s", r.stats)
         events = list(r.events)
+        if limiter:
+            limiter.report(
+                costs, is_throttled(events, self.rate_limit_throttle_patterns)
+            )
 
+        failure = None
         if r.rc != 0:
             self.log.error(f"Ansible: Non-zero exit code: {r.rc}")
             for e in events:
                 if e["event"] == "runner_on_failed":
                     self.log.error(e)
-            raise AnsibleException("Non-zero exit code", r)
-        if len(r.stats["ok"]) == 0:
+            failure = "Non-zero exit code"
+        elif len(r.stats["ok"]) == 0:
             self.log.error(f"Ansible: No successful tasks: {r.stats}")
-            raise AnsibleException("No successful tasks", r)
-
-        ansiblespawner_out = {}
-        for e in events:
-            if e["event"] == "runner_on_ok":
-                try:
-                    ansiblespawner_out.update(
-                        e["event_data"]["res"]["ansible_facts"]["ansiblespawner_out"]
-                    )
-                except KeyError:
-                    continue
+            failure = "No successful tasks"
+
+        if tmpdir and self.artifact_dir:
+            self._archive_tmpdir(tmpdir, key, operation, r, bool(failure))
+            tmpdir = None
+        if failure:
+            raise AnsibleException(failure, r)
 
         return dict(
-            ansiblespawner_out=ansiblespawner_out,
+            ansiblespawner_out=_get_ansiblespawner_out(events),
             events=events,
             rc=r.rc,
             stats=r.stats,
@@ -307,7 +852,106 @@ class AnsibleSpawner(Spawner):
             tmpdir=tmpdir,
         )
 
-    def _cleanup_tmpdir(self, tmpdir: tempfile.TemporaryDirectory) -> None:
+    def _get_rate_limiter(self):
+        return get_rate_limiter(self.rate_limits)
+
+    def _get_rate_limit_costs(
+        self, operation: OptionalT[str], servers: int = 1
+    ) -> DictT[str, float]:
+        """
+        The rate limit costs of an operation for a number of servers, empty if
+        it's not limited
+        """
+        if not self.rate_limits or not operation:
+            return {}
+        if operation in self.rate_limit_costs:
+            costs = self.rate_limit_costs[operation]
+        else:
+            costs = self.rate_limit_costs.get(operation.split("-")[0], {})
+        return {budget: tokens * servers for budget, tokens in costs.items()}
+
+    def _get_log_event_handler(
+        self, operation: OptionalT[str], key: OptionalT[str] = None
+    ):
+        """
+        Return an Ansible event handler that writes events to the debug log and
+        the structured event log, or None if neither is enabled.
+
+        Debug messages are only formatted when debug logging is enabled.
+        """
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        writer = None
+        if self.event_log_dir:
+            writer = get_event_log_writer(
+                self.event_log_dir,
+                self.event_log_max_bytes,
+                self.event_log_backup_count,
+            )
+        if not debug and not writer:
+            return None
+
+        name = (key or self._get_server_key()) if writer else ""
+
+        def log_event_handler(e: JsonT) -> bool:
+            if debug:
+                self.log.debug(
+                    e["event"] + (("\n" + e["stdout"]) if "stdout" in e else "")
+                )
+            if writer:
+                writer.write(name, {"operation": operation, "event": e})
+            # Needs to return True otherwise the event is discarded
+            # https://github.com/ansible/ansible-runner/blob/1.4.6/ansible_runner/runner.py#L69
+            return True
+
+        return log_event_handler
+
+    def _get_server_key(self) -> str:
+        """
+        A unique key for this user's server
+        """
+        name = self.user.escaped_name
+        if self.name:
+            name += f"-{self.name}"
+        return name
+
+    def _get_artifact_store(self):
+        return get_artifact_store(
+            self.artifact_dir,
+            self.artifact_max_bytes,
+            self.artifact_max_age,
+            self.artifact_keep,
+        )
+
+    def _archive_tmpdir(
+        self,
+        tmpdir: tempfile.TemporaryDirectory,
+        key: OptionalT[str],
+        operation: OptionalT[str],
+        r: UnionT[ansible_runner.Runner, RunResult],
+        failed: bool,
+    ) -> None:
+        """
+        Hand a run directory to the artifact store, which deletes it after
+        archiving
+        """
+        self._get_artifact_store().add(
+            key or self._get_server_key(),
+            tmpdir.name,
+            {
+                "operation": operation,
+                "status": r.status,
+                "rc": r.rc,
+                "failed": failed,
+            },
+            # Keeps tmpdir alive until it's archived
+            cleanup=tmpdir.cleanup,
+        )
+
+    def _cleanup_tmpdir(self, tmpdir: OptionalT[tempfile.TemporaryDirectory]) -> None:
+        if tmpdir is None:
+            # private_data_dir was passed to run_ansible, the run was batched,
+            # or the run directory was archived
+            return
         if self.keep_temp_dirs:
             self.log.info(f"Not deleting tmpdir {tmpdir.name}")
         else:
@@ -318,7 +962,12 @@ class AnsibleSpawner(Spawner):
         return []
 
     async def _get_inventory(self) -> TupleT[str, str]:
-        args = await self._get_extravars()
+        return self._render_inventory(await self._get_extravars())
+
+    def _render_inventory(self, args: JsonT) -> TupleT[str, str]:
+        """
+        Render the inventory with the playbook variables
+        """
         if callable(self.inventory):
             return self.inventory(**args)
         with open(self.inventory) as f:
@@ -356,6 +1005,8 @@ class AnsibleSpawner(Spawner):
             "user": self._get_user(),
             "spawner_environment": self.get_env(),
         }
+        if self.placement:
+            vars["placement"] = self.placement
         if self.playbook_vars:
             if callable(self.playbook_vars):
                 vars.update(self.playbook_vars())
@@ -366,23 +1017,525 @@ class AnsibleSpawner(Spawner):
     def load_state(self, state: dict) -> None:
         super().load_state(state)
         self.serverinfo = state.get("serverinfo")
+        self.checkpoint = state.get("checkpoint")
+        self.suspended_at = state.get("suspended_at")
+        # Replaces or cancels the timer of a previous spawner for this server
+        self._schedule_suspended_expiry()
+        if self.checkpoint:
+            # Checkpoints saved by older versions have no time
+            self.checkpoint.setdefault("time", time.time())
+        self._schedule_checkpoint_expiry()
+        self.placement = (self.serverinfo or {}).get("placement")
+        if self.placement and self.placement_hosts:
+            self._get_host_pool().restore(self._get_server_key(), self.placement)
+        running = self.serverinfo and not (self.checkpoint or self.suspended_at)
+        self.lifecycle.transition("running" if running else "idle")
+        try:
+            asyncio.get_running_loop().call_soon(self._load_stopped_servers)
+        except RuntimeError:
+            pass
+
+    def _load_stopped_servers(self) -> None:
+        """
+        JupyterHub only creates the spawners of running servers when it starts,
+        so the expiry of a suspended server or incomplete start whose user
+        doesn't return would never be scheduled, and the host capacity it holds
+        would not be counted. Once per hub, when the first spawner is loaded,
+        create the spawners of stopped servers that have state to expire or a
+        placement so their load_state schedules the expiry and restores the
+        placement.
+        """
+        if not JupyterHub.initialized():
+            return
+        app = JupyterHub.instance()
+        if id(app) in _loaded_hubs:
+            return
+        _loaded_hubs.add(id(app))
+        for orm_spawner in app.db.query(orm.Spawner):
+            state = orm_spawner.state or {}
+            if orm_spawner.user is None or not (
+                state.get("suspended_at")
+                or state.get("checkpoint")
+                or (state.get("serverinfo") or {}).get("placement")
+            ):
+                continue
+            user = app.users[orm_spawner.user]
+            if orm_spawner.name not in user.spawners:
+                self.log.info(
+                    "Loading stopped server %s %s",
+                    orm_spawner.user.name,
+                    orm_spawner.name,
+                )
+                # Creating the spawner calls load_state
+                user.spawners[orm_spawner.name]
 
     def get_state(self) -> JsonT:
         state = super().get_state()
         if self.serverinfo:
             state["serverinfo"] = self.serverinfo
+        if self.checkpoint:
+            state["checkpoint"] = self.checkpoint
+        if self.suspended_at:
+            state["suspended_at"] = self.suspended_at
         return state
 
+    def _persist_state(self) -> None:
+        """
+        Write the current state to the database, JupyterHub normally only does
+        this after start() returns
+        """
+        if self.orm_spawner is None:
+            return
+        db = object_session(self.orm_spawner)
+        if db is not None:
+            self.orm_spawner.state = self.get_state()
+            db.commit()
+
+    def _save_checkpoint(self, phase: str, out: JsonT) -> None:
+        if not self.resumable_start:
+            return
+        checkpoint = self.checkpoint or {"phases": [], "outputs": {}}
+        checkpoint["phases"].append(phase)
+        checkpoint["outputs"][phase] = out
+        checkpoint.get("partial", {}).pop(phase, None)
+        checkpoint["time"] = time.time()
+        self.checkpoint = checkpoint
+        self._persist_state()
+
+    def _save_partial_outputs(self, phase: str, out: JsonT) -> None:
+        """
+        Save the outputs of a phase that failed part way through
+        """
+        if not out:
+            return
+        self.serverinfo = dict(self.serverinfo or {}, **out)
+        if self.placement:
+            self.serverinfo["placement"] = self.placement
+        if self.resumable_start:
+            checkpoint = self.checkpoint or {"phases": [], "outputs": {}}
+            checkpoint.setdefault("partial", {})[phase] = out
+            checkpoint["time"] = time.time()
+            self.checkpoint = checkpoint
+        self._persist_state()
+
+    async def _resume_checkpoint(self) -> ListT[str]:
+        """
+        Restore serverinfo from a checkpoint and return the completed phases if
+        the server is still running, otherwise discard the checkpoint
+        """
+        self._cancel_checkpoint_expiry()
+        if not self.resumable_start or not self.checkpoint:
+            return []
+        phases = self.checkpoint.get("phases", [])
+        serverinfo: JsonT = {}
+        for phase in phases:
+            serverinfo.update(self.checkpoint["outputs"].get(phase) or {})
+        for out in self.checkpoint.get("partial", {}).values():
+            serverinfo.update(out)
+        self.serverinfo = serverinfo
+
+        if self._checkpoint_expired():
+            self.log.warning("Checkpoint expired")
+            running = False
+        else:
+            try:
+                running = await self._run_poll_playbook()
+            except AnsibleException as e:
+                self.log.warning("Checkpoint validation failed: %s", e)
+                running = False
+        if running:
+            self.log.info("Resuming start after phases %s", phases)
+            return phases
+
+        self.log.warning("Discarding checkpoint, destroying incomplete server")
+        try:
+            await self._destroy()
+        except AnsibleException as e:
+            self.log.error("Failed to destroy incomplete server: %s", e)
+        self.checkpoint = None
+        self.serverinfo = None
+        self._release_placement()
+        self.placement = None
+        return []
+
+    def _get_host_pool(self):
+        return get_host_pool(self.placement_hosts, self.placement_policy)
+
+    def _allocate_placement(self) -> None:
+        if not self.placement_hosts:
+            return
+        # Placements held by stopped servers must be restored first
+        self._load_stopped_servers()
+        pool = self._get_host_pool()
+        key = self._get_server_key()
+        # Placements loaded from state are restored in load_state. A placement
+        # kept after a failed start has been released so capacity must be
+        # checked again
+        existing = pool.placement(key)
+        if existing:
+            self.placement = existing
+            return
+        request = self.placement_request or {}
+        if callable(request):
+            request = request()
+        self.placement = pool.allocate(key, request)
+        self.log.info("Placed server on %s", self.placement["host"])
+
+    def _release_placement(self) -> None:
+        """
+        Release the capacity used by this server, self.placement is kept so it
+        can still be passed to the destroy_playbook
+        """
+        if self.placement and self.placement_hosts:
+            self._get_host_pool().release(self._get_server_key())
+
+    def _schedule_suspended_expiry(self) -> None:
+        if not self.suspended_at or self.suspended_lifetime <= 0:
+            self._cancel_suspended_expiry()
+            return
+        # Without a running loop (e.g. state loaded outside the hub) expiry is
+        # checked in start()
+        schedule_expiry(
+            f"{self._get_server_key()}:suspended",
+            self.suspended_at + self.suspended_lifetime - time.time(),
+            self._expire_suspended,
+        )
+
+    def _cancel_suspended_expiry(self) -> None:
+        cancel_expiry(f"{self._get_server_key()}:suspended")
+
+    def _suspended_expired(self) -> bool:
+        return bool(
+            self.suspended_at
+            and self.suspended_lifetime > 0
+            and time.time() > self.suspended_at + self.suspended_lifetime
+        )
+
+    async def _expire_suspended(self) -> None:
+        if not self._suspended_expired() or self._start_pending:
+            return
+        self.log.info("Suspended server expired, destroying")
+        try:
+            await self.stop(now=True)
+        except AnsibleException as e:
+            self.log.error("Failed to destroy expired server: %s", e)
+            return
+        self.serverinfo = None
+        self._persist_state()
+
+    def _schedule_checkpoint_expiry(self) -> None:
+        if not self.checkpoint or self.checkpoint_lifetime <= 0:
+            self._cancel_checkpoint_expiry()
+            return
+        # Without a running loop (e.g. state loaded outside the hub) expiry is
+        # checked in start()
+        schedule_expiry(
+            f"{self._get_server_key()}:checkpoint",
+            self.checkpoint["time"] + self.checkpoint_lifetime - time.time(),
+            self._expire_checkpoint,
+        )
+
+    def _cancel_checkpoint_expiry(self) -> None:
+        cancel_expiry(f"{self._get_server_key()}:checkpoint")
+
+    def _checkpoint_expired(self) -> bool:
+        return bool(
+            self.checkpoint
+            and self.checkpoint_lifetime > 0
+            and time.time() > self.checkpoint["time"] + self.checkpoint_lifetime
+        )
+
+    async def _expire_checkpoint(self) -> None:
+        if not self._checkpoint_expired() or self._start_pending:
+            return
+        self.log.info("Checkpoint of incomplete start expired, destroying")
+        try:
+            await self.stop(now=True)
+        except AnsibleException as e:
+            self.log.error("Failed to destroy incomplete server: %s", e)
+            return
+        self.serverinfo = None
+        self._persist_state()
+
+    async def _resume_suspended(self) -> ListT[str]:
+        """
+        Resume or destroy a suspended server, return ["create"] if the server was
+        resumed so the create phase is skipped
+        """
+        if not self.suspended_at:
+            return []
+        self._cancel_suspended_expiry()
+        loop = asyncio.get_event_loop()
+
+        if not self._suspended_expired() and self.resume_playbook:
+            inv = await self._get_inventory()
+            extravars = await self._get_extravars()
+            try:
+                resume = await self.run_ansible(
+                    loop,
+                    inv,
+                    extravars=extravars,
+                    quiet=not self.debug,
+                    playbook=os.path.abspath(self.resume_playbook),
+                    operation="resume",
+                )
+            except AnsibleException as e:
+                self.log.warning("Failed to resume server, recreating: %s", e)
+            else:
+                self.log.debug(
+                    "resume_playbook ansiblespawner_out: %s",
+                    resume["ansiblespawner_out"],
+                )
+                self._cleanup_tmpdir(resume["tmpdir"])
+                self.serverinfo = dict(self.serverinfo or {})
+                self.serverinfo.update(resume["ansiblespawner_out"] or {})
+                self.suspended_at = None
+                self._save_checkpoint("create", self.serverinfo)
+                return ["create"]
+
+        self.log.info("Destroying suspended server before creating a new one")
+        await self._destroy()
+        self.serverinfo = None
+        return []
+
+    async def _batched_create(self, extravars: JsonT, event_handler) -> JsonT:
+        """
+        Run the create_playbook in a batch with other users' starts
+        """
+        playbook = os.path.abspath(self.create_playbook)
+        batcher = get_batcher(
+            ("create", playbook), self.start_batch_window, self.start_batch_max_size
+        )
+        item = {
+            "host": f"ansiblespawner-{self._get_server_key()}",
+            "hostvars": extravars,
+            "event_handler": event_handler,
+        }
+        return await batcher.submit(item, self._run_create_batch)
+
+    async def _run_create_batch(self, items: ListT[JsonT]) -> ListT[AnyT]:
+        """
+        Run the create_playbook for a batch of users
+        items: List of dictionaries with fields host, hostvars and event_handler
+        Returns a list with a result or AnsibleException for each item
+        """
+        hosts = {}
+        handlers = {}
+        for item in items:
+            hostvars = {
+                "ansible_connection": "local",
+                "ansible_python_interpreter": "{{ ansible_playbook_python }}",
+            }
+            hostvars.update(item["hostvars"])
+            hosts[item["host"]] = hostvars
+            handlers[item["host"]] = item["event_handler"]
+        inventory = {"all": {"children": {BATCH_GROUP: {"hosts": hosts}}}}
+
+        def event_handler(e: JsonT) -> bool:
+            # Events for a host go to that user, other events to everyone
+            host = e.get("event_data", {}).get("host")
+            for h, handler in handlers.items():
+                if host is None or host == h:
+                    handler(e)
+            return True
+
+        self.log.info("Running batched create for %d users", len(items))
+        try:
+            r = await self.run_ansible(
+                asyncio.get_event_loop(),
+                inventory,
+                extravars={},
+                forks=min(len(items), self.start_batch_max_forks),
+                quiet=not self.debug,
+                playbook=os.path.abspath(self.create_playbook),
+                operation="create-batch",
+                servers=len(items),
+                # The run includes every user's variables so isn't logged or
+                # archived under one user's key
+                key=BATCH_GROUP,
+                event_handler=event_handler,
+            )
+            self._cleanup_tmpdir(r["tmpdir"])
+            run = RunResult(r["rc"], r["status"], r["stats"], r["events"])
+        except AnsibleException as e:
+            run = RunResult(e.rc, e.status, e.stats, e.events)
+
+        results: ListT[AnyT] = []
+        for item in items:
+            host = item["host"]
+            events = [
+                e
+                for e in run.events
+                if e.get("event_data", {}).get("host") in (None, host)
+            ]
+            host_run = RunResult(run.rc, run.status, run.stats, events)
+            stats = run.stats or {}
+            if not stats or host in stats["failures"] or host in stats["dark"]:
+                results.append(AnsibleException("Batched create failed", host_run))
+            elif not stats["ok"].get(host):
+                results.append(AnsibleException("No successful tasks", host_run))
+            else:
+                results.append(
+                    dict(
+                        ansiblespawner_out=_get_ansiblespawner_out(events),
+                        events=events,
+                        rc=0,
+                        stats=stats,
+                        status="successful",
+                        tmpdir=None,
+                    )
+                )
+        return results
+
+    @validate("create_playbook", "update_playbook")
+    def _validate_playbook(self, proposal):
+        if isinstance(proposal["value"], dict):
+            try:
+                PlaybookDag(proposal["value"])
+            except ValueError as e:
+                raise TraitError(f"{proposal['trait'].name}: {e}")
+        return proposal["value"]
+
+    async def _run_playbooks(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        inventory: UnionT[JsonT, TupleT[str, str]],
+        playbook: UnionT[str, JsonT],
+        operation: str,
+        extravars: JsonT,
+        event_handler,
+    ) -> JsonT:
+        """
+        Run a start playbook or graph of playbooks
+        Returns the run_ansible result, for a graph the merged
+        "ansiblespawner_out" and the events of all playbooks
+        """
+        if not isinstance(playbook, dict):
+            return await self.run_ansible(
+                loop,
+                inventory,
+                extravars=extravars,
+                quiet=not self.debug,
+                playbook=os.path.abspath(playbook),
+                operation=operation,
+                event_handler=event_handler,
+            )
+
+        events: ListT[JsonT] = []
+
+        async def run_node(name: str, node_playbook: str, deps: JsonT) -> JsonT:
+            # The serverinfo of a node includes its dependencies' outputs, so
+            # the inventory can use them
+            node_vars = dict(extravars, dependency_out=deps)
+            node_vars["serverinfo"] = dict(extravars.get("serverinfo") or {})
+            for out in deps.values():
+                node_vars["serverinfo"].update(out)
+            r = await self.run_ansible(
+                loop,
+                self._render_inventory(node_vars),
+                extravars=node_vars,
+                quiet=not self.debug,
+                playbook=os.path.abspath(node_playbook),
+                operation=f"{operation}-{name}",
+                event_handler=event_handler,
+            )
+            self.log.debug(
+                "%s playbook %s ansiblespawner_out: %s",
+                operation,
+                name,
+                r["ansiblespawner_out"],
+            )
+            self._cleanup_tmpdir(r["tmpdir"])
+            # Completion order, so the last event is the last to finish
+            events.extend(r["events"])
+            return r
+
+        try:
+            results = await PlaybookDag(playbook).run(run_node)
+        except Exception as e:
+            # Save what was created so it can be resumed or destroyed
+            self._save_partial_outputs(
+                operation, merge_outputs(getattr(e, "partial_results", []))
+            )
+            raise
+        return dict(
+            ansiblespawner_out=merge_outputs(results),
+            events=events,
+            tmpdir=None,
+        )
+
+    def _phase_key(self, operation: str, playbook: UnionT[str, JsonT]) -> str:
+        if isinstance(playbook, dict):
+            return f"{operation}:{json.dumps(playbook, sort_keys=True)}"
+        return f"{operation}:{os.path.abspath(playbook)}"
+
+    def _get_spawn_progress(
+        self, phases: ListT[TupleT[str, UnionT[str, JsonT]]]
+    ) -> OptionalT[SpawnProgress]:
+        """
+        phases: List of (operation, playbook) that will be run
+        """
+        if not self.duration_store_path or not phases:
+            return None
+        return SpawnProgress(
+            get_duration_store(self.duration_store_path),
+            [self._phase_key(op, playbook) for op, playbook in phases],
+            slow_factor=self.slow_start_factor,
+            min_samples=self.duration_min_samples,
+        )
+
+    async def _end_progress_phase(
+        self, progress: OptionalT[SpawnProgress], result: JsonT
+    ) -> None:
+        if not progress:
+            return
+        events = result.get("events")
+        # Recording the phase writes the duration store file
+        slow = await asyncio.get_event_loop().run_in_executor(
+            None, progress.end_phase, events[-1] if events else None
+        )
+        if slow:
+            self.log.warning("Slow start: %s", slow)
+
     async def start(self) -> TupleT[str, int]:
+        return await self.lifecycle.run("start", self._lifecycle_start)
+
+    async def _lifecycle_start(self) -> TupleT[str, int]:
+        self.lifecycle.transition("creating")
+        try:
+            ip_port = await self._start()
+        except Exception:
+            self.lifecycle.transition("idle")
+            if self.checkpoint:
+                self._schedule_checkpoint_expiry()
+            else:
+                # Nothing to resume so the capacity can be reused
+                self._release_placement()
+            raise
+        self.lifecycle.transition("running")
+        return ip_port
+
+    async def _start(self) -> TupleT[str, int]:
         self.port: int
         if not self.port:
             self.port = 8888
 
+        completed = await self._resume_suspended()
+        if not completed:
+            completed = await self._resume_checkpoint()
+        self._allocate_placement()
         inv = await self._get_inventory()
         extravars = await self._get_extravars()
-        self.log.debug(f"extravars: {extravars}")
+        self.log.debug("extravars: %s", extravars)
         loop = asyncio.get_event_loop()
 
+        phases = []
+        if "create" not in completed:
+            phases.append(("create", self.create_playbook))
+        if self.update_playbook and "update" not in completed:
+            phases.append(("update", self.update_playbook))
+        progress = self._get_spawn_progress(phases)
+
         # When starting we want to show progress messages.
         # Ansible async runs in a separate thread
         def event_handler(
@@ -390,58 +1543,133 @@ class AnsibleSpawner(Spawner):
             queue: asyncio.Queue,
             e: JsonT,
         ):
-            # Remove colour escape codes
-            m = e["event"] + (
-                (": " + re_sub(r"\x1b[^m]*m", "", e["stdout"])) if "stdout" in e else ""
-            )
+            estimate = progress.event(e) if progress else None
+            if estimate and estimate["slow"]:
+                self.log.warning("Slow start: %s", estimate["slow"])
+                loop.call_soon_threadsafe(
+                    queue.put_nowait,
+                    {"message": f"Slower than usual: {estimate['slow']}"},
+                )
             # Optional fields: progress, html_message
             if e["event"].startswith("playbook_on_"):
-                loop.call_soon_threadsafe(queue.put_nowait, {"message": m})
+                # Remove colour escape codes
+                m = e["event"] + (
+                    (": " + re_sub(r"\x1b[^m]*m", "", e["stdout"]))
+                    if "stdout" in e
+                    else ""
+                )
+                event: JsonT = {"message": m}
+                if estimate:
+                    event["progress"] = estimate["progress"]
+                    event["message"] += f" (about {estimate['eta']:.0f}s remaining)"
+                loop.call_soon_threadsafe(queue.put_nowait, event)
             return True
 
-        create = await self.run_ansible(
-            loop,
-            inv,
-            extravars=extravars,
-            quiet=not self.debug,
-            playbook=os.path.abspath(self.create_playbook),
-            event_handler=partial(event_handler, loop, self.events),
-        )
-        self.log.debug(
-            f'create_playbook ansiblespawner_out: {create["ansiblespawner_out"]}'
-        )
-        self._cleanup_tmpdir(create["tmpdir"])
-        self.serverinfo = create["ansiblespawner_out"] or {}
+        if "create" in completed:
+            self.events.put_nowait({"message": "Resuming existing server"})
+        else:
+            if progress:
+                progress.start_phase(self._phase_key("create", self.create_playbook))
+            if self.start_batch_window > 0 and isinstance(self.create_playbook, str):
+                create = await self._batched_create(
+                    extravars, partial(event_handler, loop, self.events)
+                )
+            else:
+                create = await self._run_playbooks(
+                    loop,
+                    inv,
+                    self.create_playbook,
+                    "create",
+                    extravars,
+                    partial(event_handler, loop, self.events),
+                )
+            self.log.debug(
+                "create_playbook ansiblespawner_out: %s", create["ansiblespawner_out"]
+            )
+            self._cleanup_tmpdir(create["tmpdir"])
+            await self._end_progress_phase(progress, create)
+            self.serverinfo = create["ansiblespawner_out"] or {}
+            if self.placement:
+                self.serverinfo["placement"] = self.placement
+            self._save_checkpoint("create", self.serverinfo)
         extravars["serverinfo"] = self.serverinfo
         # Create playbook may have modified the inventory
         inv = await self._get_inventory()
 
-        if self.update_playbook:
-            update = await self.run_ansible(
+        if self.update_playbook and "update" not in completed:
+            self.lifecycle.transition("updating")
+            if progress:
+                progress.start_phase(self._phase_key("update", self.update_playbook))
+            update = await self._run_playbooks(
                 loop,
                 inv,
-                extravars=extravars,
-                quiet=not self.debug,
-                playbook=os.path.abspath(self.update_playbook),
-                event_handler=partial(event_handler, loop, self.events),
+                self.update_playbook,
+                "update",
+                extravars,
+                partial(event_handler, loop, self.events),
             )
             self.log.debug(
-                f'update_playbook ansiblespawner_out: {update["ansiblespawner_out"]}'
+                "update_playbook ansiblespawner_out: %s", update["ansiblespawner_out"]
             )
             self._cleanup_tmpdir(update["tmpdir"])
+            await self._end_progress_phase(progress, update)
             self.serverinfo.update(update["ansiblespawner_out"] or {})
+            self._save_checkpoint("update", update["ansiblespawner_out"] or {})
 
         ip = self.serverinfo["ip"]
         port = int(self.serverinfo["port"])
+        # Start is complete, JupyterHub saves the state after start returns
+        self.checkpoint = None
 
         self.log.info(f"Started server on {ip}:{port}")
         self.events.put_nowait(None)
         return ip, port
 
     async def stop(self, now=False) -> None:
-        # TODO or not bother?
         #   now=False (default), shutdown the server gracefully
         #   now=True, terminate the server immediately.
+        # A destroy requested during a suspend must run after it, not share it
+        await self.lifecycle.run(f"stop-{now}", self._lifecycle_stop, now)
+
+    async def _lifecycle_stop(self, now: bool) -> None:
+        previous = self.lifecycle.state
+        self.lifecycle.transition("stopping")
+        try:
+            if not now and self.suspend_playbook and self.resume_playbook:
+                await self._suspend()
+            else:
+                await self._destroy()
+        except Exception:
+            self.lifecycle.transition(previous)
+            raise
+        self.lifecycle.transition("idle")
+
+    async def _suspend(self) -> None:
+        inv = await self._get_inventory()
+        extravars = await self._get_extravars()
+        loop = asyncio.get_event_loop()
+
+        suspend = await self.run_ansible(
+            loop,
+            inv,
+            extravars=extravars,
+            quiet=not self.debug,
+            playbook=os.path.abspath(self.suspend_playbook),
+            operation="suspend",
+        )
+        self.log.debug(
+            "suspend_playbook ansiblespawner_out: %s", suspend["ansiblespawner_out"]
+        )
+        self._cleanup_tmpdir(suspend["tmpdir"])
+        self.serverinfo = dict(self.serverinfo or {})
+        self.serverinfo.update(suspend["ansiblespawner_out"] or {})
+        self.checkpoint = None
+        self.suspended_at = time.time()
+        self._schedule_suspended_expiry()
+
+    async def _destroy(self) -> None:
+        self._cancel_suspended_expiry()
+        self._cancel_checkpoint_expiry()
         inv = await self._get_inventory()
         extravars = await self._get_extravars()
         loop = asyncio.get_event_loop()
@@ -452,11 +1680,18 @@ class AnsibleSpawner(Spawner):
             extravars=extravars,
             quiet=not self.debug,
             playbook=os.path.abspath(self.destroy_playbook),
+            operation="destroy",
         )
         self.log.debug(
-            f'destroy_playbook ansiblespawner_out: {destroy["ansiblespawner_out"]}'
+            "destroy_playbook ansiblespawner_out: %s", destroy["ansiblespawner_out"]
         )
         self._cleanup_tmpdir(destroy["tmpdir"])
+        self.checkpoint = None
+        self.suspended_at = None
+        self._release_placement()
+        self.placement = None
+        if self.serverinfo:
+            self.serverinfo.pop("placement", None)
 
     async def poll(self) -> UnionT[None, int]:
         # None: single-user process is running.
@@ -466,6 +1701,27 @@ class AnsibleSpawner(Spawner):
         # May be called before start when state is loaded on Hub launch,
         #   if spawner not initialized via load_state or start: unknown (0)
         # If called while start is in progress (yielded): running (None)
+        if self.lifecycle.in_transition:
+            # Answer from the state instead of polling a server that is being
+            # created or destroyed
+            return 0 if self.lifecycle.state == "stopping" else None
+        return await self.lifecycle.run("poll", self._lifecycle_poll)
+
+    async def _lifecycle_poll(self) -> UnionT[None, int]:
+        if (self.checkpoint or self.suspended_at) and not self._start_pending:
+            # An incomplete start that can be resumed or a suspended server,
+            # report it as not running so JupyterHub doesn't call stop()
+            return 0
+        if await self._run_poll_playbook():
+            return None
+        if self.lifecycle.state == "running":
+            self.lifecycle.transition("idle")
+        return 0
+
+    async def _run_poll_playbook(self) -> bool:
+        """
+        Run the poll_playbook and return whether the server is running
+        """
         inv = await self._get_inventory()
         extravars = await self._get_extravars()
         loop = asyncio.get_event_loop()
@@ -476,15 +1732,13 @@ class AnsibleSpawner(Spawner):
             extravars=extravars,
             quiet=not self.debug,
             playbook=os.path.abspath(self.poll_playbook),
+            operation="poll",
         )
         self.log.debug(
-            f'poll_playbook ansiblespawner_out: {poll["ansiblespawner_out"]}'
+            "poll_playbook ansiblespawner_out: %s", poll["ansiblespawner_out"]
         )
         self._cleanup_tmpdir(poll["tmpdir"])
-
-        if poll["ansiblespawner_out"]["running"]:
-            return None
-        return 0
+        return bool(poll["ansiblespawner_out"]["running"])
 
     async def progress(self) -> AsyncGeneratorT[int, None]:
         """
@@ -0,0 +1,252 @@
+"""
+Compressed, size-bounded retention of Ansible run directories
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+
+from typing import (
+    Any as AnyT,
+    Callable as CallableT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+_stores: DictT[TupleT, "ArtifactStore"] = {}
+_stores_lock = threading.Lock()
+
+KEEP = ("all", "failed")
+
+
+class ArtifactStore:
+    """
+    Archive finished Ansible run directories as per-user `.tar.gz` files.
+
+    Every run is recorded in `index.json`, newest first for each key:
+
+        {key: [{"time": t, "operation": op, "status": s, "rc": rc,
+                "failed": bool, "archive": relative path or None,
+                "bytes": archive size}]}
+
+    Archives are created and the limits enforced by a single background thread.
+    When the total size of the archives exceeds `max_bytes` the oldest archives
+    are deleted but their index entries are kept. Entries older than `max_age`
+    are deleted with their archives.
+
+    The size and age limits are enforced and the index saved once for each batch
+    of queued runs, or every `save_interval` seconds if runs are queued faster
+    than they are archived.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+        keep: str = "all",
+        max_runs: int = 100,
+        save_interval: float = 10,
+    ):
+        """
+        directory: Directory for the archives and index, created if missing
+        max_bytes: Maximum total size of the archives, 0 for no limit
+        max_age: Maximum age of a run in seconds, 0 for no limit
+        keep: "all" to archive every run, "failed" to only archive failed runs
+        max_runs: Maximum number of index entries for each key
+        save_interval: Maximum seconds between saves of the index while runs
+          are queued
+        """
+        if keep not in KEEP:
+            raise ValueError(f"Invalid keep {keep}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.max_runs = max_runs
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        # Runs queued but not yet recorded
+        self._pending = 0
+        self._saved = time.monotonic()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ansiblespawner-artifacts"
+        )
+        self._index: DictT[str, ListT[JsonT]] = {}
+        try:
+            with open(self._index_path()) as f:
+                self._index = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning("Ignoring invalid artifact index %s", self._index_path())
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def add(
+        self,
+        key: str,
+        path: str,
+        run: JsonT,
+        cleanup: OptionalT[CallableT[[], None]] = None,
+    ) -> Future:
+        """
+        Queue a finished run directory for archiving
+        key: Key for the user's server
+        path: The run directory
+        run: Details of the run: operation, status, rc and failed
+        cleanup: Called after archiving to delete the run directory, default
+          is to delete `path`
+        Returns a Future that completes when the run is recorded
+        """
+        run = dict(run, time=time.time())
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._add, key, path, run, cleanup)
+
+    def _add(
+        self,
+        key: str,
+        path: str,
+        run: JsonT,
+        cleanup: OptionalT[CallableT[[], None]],
+    ) -> None:
+        try:
+            run["archive"] = None
+            run["bytes"] = 0
+            if self.keep == "all" or run.get("failed"):
+                run["archive"], run["bytes"] = self._archive(key, path, run)
+        except Exception:
+            logger.exception("Failed to archive %s", path)
+        finally:
+            if cleanup:
+                cleanup()
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._pending -= 1
+            runs = self._index.setdefault(key, [])
+            runs.insert(0, run)
+            while len(runs) > self.max_runs:
+                self._delete_archive(runs.pop())
+
+            now = time.monotonic()
+            if self._pending and now - self._saved < self.save_interval:
+                # More runs are queued, prune and save once for the batch
+                return
+            self._prune()
+            self._save()
+            self._saved = now
+
+    def _archive(self, key: str, path: str, run: JsonT) -> TupleT[str, int]:
+        name = "{}-{}-{}".format(
+            datetime.utcfromtimestamp(run["time"]).strftime("%Y%m%d-%H%M%S"),
+            run.get("operation") or "run",
+            "failed" if run.get("failed") else "ok",
+        )
+        directory = os.path.join(self.directory, key)
+        os.makedirs(directory, exist_ok=True)
+        fd, archive = tempfile.mkstemp(
+            dir=directory, prefix=name + "-", suffix=".tar.gz"
+        )
+        with os.fdopen(fd, "wb") as f:
+            with tarfile.open(fileobj=f, mode="w:gz") as tar:
+                tar.add(path, arcname=name)
+        return os.path.relpath(archive, self.directory), os.path.getsize(archive)
+
+    def _delete_archive(self, run: JsonT) -> None:
+        if run.get("archive"):
+            try:
+                os.remove(os.path.join(self.directory, run["archive"]))
+            except FileNotFoundError:
+                pass
+            run["archive"] = None
+            run["bytes"] = 0
+
+    def _prune(self) -> None:
+        # Called with the lock held
+        cutoff = time.time() - self.max_age if self.max_age else None
+        for key in list(self._index):
+            runs = self._index[key]
+            keep = []
+            for n, run in enumerate(runs):
+                if n >= self.max_runs or (cutoff and run["time"] < cutoff):
+                    self._delete_archive(run)
+                else:
+                    keep.append(run)
+            if keep:
+                self._index[key] = keep
+            else:
+                del self._index[key]
+
+        if not self.max_bytes:
+            return
+        archived = sorted(
+            (run for runs in self._index.values() for run in runs if run["archive"]),
+            key=lambda run: run["time"],
+        )
+        total = sum(run["bytes"] for run in archived)
+        for run in archived:
+            if total <= self.max_bytes:
+                break
+            total -= run["bytes"]
+            self._delete_archive(run)
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".index-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path())
+
+    def runs(self, key: str, n: OptionalT[int] = None) -> ListT[JsonT]:
+        """
+        The most recent runs for a key, newest first. `archive` is an absolute
+        path or None if the run wasn't archived or the archive was deleted.
+        """
+        with self._lock:
+            runs = self._index.get(key, [])[:n]
+            return [
+                dict(
+                    run,
+                    archive=(
+                        os.path.join(self.directory, run["archive"])
+                        if run["archive"]
+                        else None
+                    ),
+                )
+                for run in runs
+            ]
+
+    def flush(self, timeout: OptionalT[float] = None) -> None:
+        """
+        Block until all queued runs have been recorded
+        """
+        self._executor.submit(lambda: None).result(timeout)
+
+
+def get_artifact_store(
+    directory: str, max_bytes: int, max_age: float, keep: str
+) -> ArtifactStore:
+    """
+    Get a process-wide ArtifactStore so all spawners share the same limits
+    """
+    key = (os.path.abspath(directory), max_bytes, max_age, keep)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ArtifactStore(*key)
+        return _stores[key]
@@ -0,0 +1,91 @@
+"""
+Group concurrent operations from different spawners into batches
+"""
+
+import asyncio
+
+from typing import (
+    Any as AnyT,
+    Awaitable as AwaitableT,
+    Callable as CallableT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+BatchRunT = CallableT[[ListT[AnyT]], AwaitableT[ListT[AnyT]]]
+
+_batchers: DictT[TupleT, "Batcher"] = {}
+
+
+class Batcher:
+    """
+    Collect items submitted within a time window and run them together.
+
+    The first item submitted opens a batch, which is run when `window` seconds
+    have passed or `max_size` items have been submitted, whichever is first.
+    The batch is run by the `run` callable of the first item, which must return
+    a list with a result or an exception for each item.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        """
+        window: Seconds to wait for more items after the first
+        max_size: Maximum number of items in a batch
+        """
+        self.window = window
+        self.max_size = max_size
+        self._pending: ListT[TupleT[AnyT, asyncio.Future]] = []
+        self._run: BatchRunT
+        self._timer: OptionalT[asyncio.TimerHandle] = None
+
+    async def submit(self, item: AnyT, run: BatchRunT) -> AnyT:
+        """
+        Add an item to the current batch and wait for its result
+        item: The item
+        run: Async callable used to run the batch if this item opens it
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            self._run = run
+            self._timer = loop.call_later(self.window, self._flush)
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending
+        self._pending = []
+        if batch:
+            asyncio.ensure_future(self._run_batch(self._run, batch))
+
+    async def _run_batch(
+        self, run: BatchRunT, batch: ListT[TupleT[AnyT, asyncio.Future]]
+    ) -> None:
+        try:
+            results = await run([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def get_batcher(key: TupleT, window: float, max_size: int) -> Batcher:
+    """
+    Get a process-wide Batcher so all spawners with the same key share batches
+    """
+    key = key + (window, max_size)
+    if key not in _batchers:
+        _batchers[key] = Batcher(window, max_size)
+    return _batchers[key]
@@ -0,0 +1,136 @@
+"""
+Run a graph of playbooks with dependencies, independent playbooks concurrently
+"""
+
+import asyncio
+
+from typing import (
+    Any as AnyT,
+    Awaitable as AwaitableT,
+    Callable as CallableT,
+    Dict as DictT,
+    List as ListT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+# async run(name, playbook, dependency outputs) -> run_ansible result
+NodeRunT = CallableT[[str, str, DictT[str, JsonT]], AwaitableT[JsonT]]
+
+
+class PlaybookDag:
+    """
+    A graph of playbooks, for example:
+
+        {
+            "volume": "volume.yml",
+            "secgroup": "secgroup.yml",
+            "instance": {
+                "playbook": "instance.yml",
+                "depends": ["volume", "secgroup"],
+            },
+        }
+
+    `order` is a topological order of the nodes with ties broken by the order
+    they were declared in. This is the order the outputs are merged in.
+    """
+
+    def __init__(self, spec: JsonT):
+        """
+        spec: Dictionary of node name to a playbook path or a dictionary with
+          fields "playbook" and optionally "depends", a list of node names
+        Raises ValueError if the graph is invalid
+        """
+        if not spec:
+            raise ValueError("Playbook graph is empty")
+        self.playbooks: DictT[str, str] = {}
+        self.depends: DictT[str, ListT[str]] = {}
+        for name, node in spec.items():
+            if isinstance(node, str):
+                node = {"playbook": node}
+            if not isinstance(node, dict) or not node.get("playbook"):
+                raise ValueError(f"Playbook graph node {name} has no playbook")
+            self.playbooks[name] = node["playbook"]
+            self.depends[name] = list(node.get("depends", []))
+        for name, depends in self.depends.items():
+            for d in depends:
+                if d not in self.playbooks:
+                    raise ValueError(f"Playbook graph node {name} depends on {d}")
+        self.order = self._sort()
+
+    def _sort(self) -> ListT[str]:
+        order: ListT[str] = []
+        remaining = list(self.playbooks)
+        while remaining:
+            for name in remaining:
+                if all(d in order for d in self.depends[name]):
+                    order.append(name)
+                    remaining.remove(name)
+                    break
+            else:
+                raise ValueError(f"Playbook graph has a cycle between {remaining}")
+        return order
+
+    async def run(self, run_node: NodeRunT) -> ListT[TupleT[str, JsonT]]:
+        """
+        Run each node as soon as its dependencies have completed.
+        If a node fails no more nodes are started, and the first exception is
+        raised once the running nodes have finished with the attribute
+        `partial_results`, a list of (name, result) of the nodes that succeeded
+        in `order`.
+        run_node: Async callable to run a node, passed the node name, playbook
+          and a dictionary of the "ansiblespawner_out" of its dependencies
+        Returns a list of (name, result) in `order`
+        """
+        results: DictT[str, JsonT] = {}
+        running: DictT[asyncio.Future, str] = {}
+        error = None
+        while True:
+            if error is None:
+                for name in self.order:
+                    if (
+                        name not in results
+                        and name not in running.values()
+                        and all(d in results for d in self.depends[name])
+                    ):
+                        deps = {
+                            d: results[d].get("ansiblespawner_out") or {}
+                            for d in self.depends[name]
+                        }
+                        task = asyncio.ensure_future(
+                            run_node(name, self.playbooks[name], deps)
+                        )
+                        running[task] = name
+            if not running:
+                break
+            try:
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+            except asyncio.CancelledError:
+                for pending in running:
+                    pending.cancel()
+                raise
+            for finished in done:
+                name = running.pop(finished)
+                if finished.exception():
+                    error = error or finished.exception()
+                else:
+                    results[name] = finished.result()
+        completed = [(name, results[name]) for name in self.order if name in results]
+        if error:
+            error.partial_results = completed  # type: ignore[attr-defined]
+            raise error
+        return completed
+
+
+def merge_outputs(results: ListT[TupleT[str, JsonT]]) -> JsonT:
+    """
+    Shallow merge the "ansiblespawner_out" of each result, later results
+    have a higher priority
+    """
+    out: JsonT = {}
+    for _, result in results:
+        out.update(result.get("ansiblespawner_out") or {})
+    return out
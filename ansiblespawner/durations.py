@@ -0,0 +1,251 @@
+"""
+Historical task and phase durations used to estimate spawn progress
+"""
+
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+_stores: DictT[str, "DurationStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def _ewma(stat: OptionalT[JsonT], value: float, alpha: float) -> JsonT:
+    if not stat:
+        return {"mean": value, "count": 1}
+    return {
+        "mean": alpha * value + (1 - alpha) * stat["mean"],
+        "count": stat["count"] + 1,
+    }
+
+
+class DurationStore:
+    """
+    Exponentially weighted mean durations of playbook runs and their tasks,
+    saved to a small JSON file.
+
+    Entries are keyed by phase, e.g. "create:/path/to/create.yml":
+
+        {"mean": seconds, "count": n, "tasks": {task: {"mean": s, "count": n}}}
+    """
+
+    def __init__(self, path: str, alpha: float = 0.3):
+        """
+        path: JSON file, created if missing
+        alpha: Weight of the newest sample in the moving average
+        """
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._data: DictT[str, JsonT] = {}
+        try:
+            with open(path) as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning("Ignoring invalid duration store %s", path)
+
+    def get(self, key: str) -> OptionalT[JsonT]:
+        with self._lock:
+            return self._data.get(key)
+
+    def record(
+        self, key: str, duration: float, tasks: ListT[TupleT[str, float]]
+    ) -> None:
+        """
+        Add a completed run
+        key: Phase key
+        duration: Duration of the phase in seconds
+        tasks: List of (task key, duration in seconds)
+        """
+        with self._lock:
+            entry = self._data.get(key) or {"tasks": {}}
+            phase = _ewma(entry if "mean" in entry else None, duration, self.alpha)
+            entry.update(phase)
+            for task, seconds in tasks:
+                entry["tasks"][task] = _ewma(
+                    entry["tasks"].get(task), seconds, self.alpha
+                )
+            self._data[key] = entry
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".durations-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._data, f)
+        os.replace(tmp, self.path)
+
+
+def get_duration_store(path: str) -> DurationStore:
+    """
+    Get a process-wide DurationStore so all spawners share the same data
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = DurationStore(path)
+        return _stores[path]
+
+
+def _event_time(e: JsonT) -> float:
+    try:
+        created = datetime.fromisoformat(e["created"].replace("Z", "+00:00"))
+        # Older ansible-runner timestamps are UTC without a timezone
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return created.timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class SpawnProgress:
+    """
+    Estimate the progress of a sequence of phases (playbook runs) from the
+    Ansible events and the historical durations in a DurationStore.
+
+    Tasks are identified by their name and occurrence in the playbook so the
+    estimate follows the order tasks actually run in. A phase may run several
+    playbooks concurrently (a graph), the tasks of each run are tracked
+    separately by the event's runner_ident.
+    """
+
+    def __init__(
+        self,
+        store: DurationStore,
+        phases: ListT[str],
+        slow_factor: float = 2.0,
+        min_samples: int = 3,
+    ):
+        """
+        store: Historical durations
+        phases: Keys of the phases that will be run, in order
+        slow_factor: A phase is slow if it takes this many times its mean
+        min_samples: Minimum number of past runs before estimates are used
+        """
+        self.store = store
+        self.phases = phases
+        self.slow_factor = slow_factor
+        self._phase_means: ListT[float] = []
+        self._task_means: ListT[DictT[str, float]] = []
+        for key in phases:
+            entry = store.get(key)
+            if entry and entry.get("count", 0) >= min_samples:
+                self._phase_means.append(entry["mean"])
+                self._task_means.append(
+                    {k: v["mean"] for k, v in entry.get("tasks", {}).items()}
+                )
+        # Only estimate if there's enough history for every phase
+        self.known = len(self._phase_means) == len(phases)
+        # Events from concurrent playbooks arrive on different threads
+        self._lock = threading.Lock()
+        self._index = 0
+        self._reset_phase()
+
+    def _reset_phase(self) -> None:
+        self._phase_start: OptionalT[float] = None
+        # Current task and task occurrences of each playbook run
+        self._running: DictT[str, TupleT[str, float]] = {}
+        self._task_counts: DictT[str, DictT[str, int]] = {}
+        self._tasks: ListT[TupleT[str, float]] = []
+        self._expected_done = 0.0
+        self._flagged = False
+
+    def start_phase(self, key: str) -> None:
+        self._index = self.phases.index(key)
+        self._reset_phase()
+
+    def _finish_task(self, run: str, now: float) -> None:
+        task = self._running.pop(run, None)
+        if task:
+            name, started = task
+            seconds = max(now - started, 0.0)
+            self._tasks.append((name, seconds))
+            if self.known:
+                self._expected_done += self._task_means[self._index].get(name, seconds)
+
+    def event(self, e: JsonT) -> OptionalT[JsonT]:
+        """
+        Update the current phase with an Ansible event.
+        Returns {"progress": percent, "eta": seconds, "slow": message or None}
+        if progress can be estimated, otherwise None.
+        """
+        with self._lock:
+            return self._event(e)
+
+    def _event(self, e: JsonT) -> OptionalT[JsonT]:
+        now = _event_time(e)
+        if self._phase_start is None:
+            self._phase_start = now
+        run = e.get("runner_ident", "")
+        if e["event"] == "playbook_on_task_start":
+            self._finish_task(run, now)
+            task = e.get("event_data", {}).get("task", "")
+            counts = self._task_counts.setdefault(run, {})
+            n = counts.get(task, 0)
+            counts[task] = n + 1
+            self._running[run] = (f"{task}#{n}", now)
+        elif e["event"] == "playbook_on_stats":
+            self._finish_task(run, now)
+
+        if not self.known:
+            return None
+        total = sum(self._phase_means)
+        mean = self._phase_means[self._index]
+        expected_done = sum(self._phase_means[: self._index]) + min(
+            self._expected_done, mean
+        )
+        slow = None
+        elapsed = now - self._phase_start
+        if not self._flagged and elapsed > self.slow_factor * mean:
+            self._flagged = True
+            slow = self._slow_message(elapsed)
+        progress = int(100 * expected_done / total) if total > 0 else 0
+        return {
+            "progress": min(progress, 99),
+            "eta": max(total - expected_done, 0.0),
+            "slow": slow,
+        }
+
+    def _slow_message(self, elapsed: float) -> str:
+        mean = self._phase_means[self._index]
+        return (
+            f"{self.phases[self._index]} has taken {elapsed:.0f}s, "
+            f"usually {mean:.0f}s"
+        )
+
+    def end_phase(self, e: OptionalT[JsonT] = None) -> OptionalT[str]:
+        """
+        Record the completed phase in the store
+        e: The last event of the phase, if available
+        Returns a message if the phase was slower than its baseline.
+        """
+        with self._lock:
+            if self._phase_start is None:
+                return None
+            now = _event_time(e) if e else time.time()
+            for run in list(self._running):
+                self._finish_task(run, now)
+            duration = now - self._phase_start
+        self.store.record(self.phases[self._index], duration, self._tasks)
+        if self.known and duration > self.slow_factor * self._phase_means[self._index]:
+            return self._slow_message(duration)
+        return None
@@ -0,0 +1,158 @@
+"""
+Structured Ansible event log written by a background thread
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+_writers: DictT[TupleT[str, int, int], "EventLogWriter"] = {}
+_writers_lock = threading.Lock()
+
+
+class EventLogWriter:
+    """
+    Append JSON records to rotating per-user JSONL files.
+
+    Records are queued by `write` which never blocks, and are serialised and
+    written in batches by a daemon thread so neither the asyncio loop nor the
+    Ansible event callbacks wait for disk IO.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+    ):
+        """
+        directory: Directory for the JSONL files, created if missing
+        max_bytes: Rotate a file when it would exceed this size, 0 to disable
+        backup_count: Number of rotated files to keep
+        flush_interval: Maximum seconds a record waits before being written
+        batch_size: Maximum number of records written in one batch
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[AnyT]" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="ansiblespawner-eventlog", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, name: str, record: JsonT) -> None:
+        """
+        Queue a record for the log file `<name>.jsonl`
+        """
+        self._queue.put((name, record))
+
+    def flush(self, timeout: OptionalT[float] = None) -> None:
+        """
+        Block until all records queued before this call have been written
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: OptionalT[float] = None) -> None:
+        """
+        Write all queued records and stop the background thread
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch: ListT[TupleT[str, JsonT]] = []
+            waiters: ListT[threading.Event] = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                logger.exception("Failed to write Ansible event log")
+            for w in waiters:
+                w.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: ListT[TupleT[str, JsonT]]) -> None:
+        lines: DictT[str, ListT[str]] = {}
+        for name, record in batch:
+            lines.setdefault(name, []).append(json.dumps(record, default=str) + "\n")
+        if lines:
+            os.makedirs(self.directory, exist_ok=True)
+        for name, content in lines.items():
+            data = "".join(content)
+            filename = self.path(name)
+            self._maybe_rotate(filename, len(data.encode()))
+            with open(filename, "a") as f:
+                f.write(data)
+
+    def _maybe_rotate(self, filename: str, nbytes: int) -> None:
+        if self.max_bytes <= 0:
+            return
+        try:
+            size = os.path.getsize(filename)
+        except FileNotFoundError:
+            return
+        if size == 0 or size + nbytes <= self.max_bytes:
+            return
+        if self.backup_count <= 0:
+            os.remove(filename)
+            return
+        for n in range(self.backup_count - 1, 0, -1):
+            src = f"{filename}.{n}"
+            if os.path.exists(src):
+                os.replace(src, f"{filename}.{n + 1}")
+        os.replace(filename, f"{filename}.1")
+
+
+def get_event_log_writer(
+    directory: str, max_bytes: int, backup_count: int
+) -> EventLogWriter:
+    """
+    Get a process-wide EventLogWriter so all spawners share one background thread
+    """
+    key = (os.path.abspath(directory), max_bytes, backup_count)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = EventLogWriter(
+                key[0], max_bytes=max_bytes, backup_count=backup_count
+            )
+        return _writers[key]
@@ -0,0 +1,280 @@
+"""
+Executors run Ansible playbooks for the spawner, either in the JupyterHub
+process or on remote workers
+"""
+
+import ansible_runner
+import asyncio
+import os
+import ssl
+from traitlets import Float, List, Unicode
+from traitlets.config import LoggingConfigurable
+
+from .worker import (
+    WorkerError,
+    auth_digest,
+    is_local_address,
+    open_connection,
+    recv_message,
+    send_message,
+)
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+
+class RunResult:
+    """
+    The subset of ansible_runner.Runner used by the spawner, for runs that
+    did not happen in this process
+    """
+
+    def __init__(
+        self,
+        rc: int,
+        status: str,
+        stats: AnyT,
+        events: ListT[JsonT],
+    ):
+        self.rc = rc
+        self.status = status
+        self.stats = stats
+        self.events = events
+
+    def __repr__(self):
+        return f"RunResult(rc={self.rc}, status={self.status})"
+
+
+class Executor(LoggingConfigurable):
+    """
+    Base class for running Ansible
+    """
+
+    async def run(self, loop: asyncio.AbstractEventLoop, **kwargs):
+        """
+        Run Ansible and return an object with the attributes
+        rc, status, stats and events (see ansible_runner.Runner)
+        loop: The event loop
+        *kwargs: Keyword arguments for ansible_runner.run_async
+        """
+        raise NotImplementedError()
+
+
+class LocalExecutor(Executor):
+    """
+    Run Ansible in a thread in the JupyterHub process
+    """
+
+    async def run(
+        self, loop: asyncio.AbstractEventLoop, **kwargs
+    ) -> ansible_runner.Runner:
+        # https://docs.python.org/3.6/library/asyncio-task.html#example-future-with-run-until-complete
+
+        # Ansible runs in a different thread from asyncio so must use
+        # call_soon_threadsafe
+        # https://docs.python.org/3.6/library/asyncio-dev.html#concurrency-and-multithreading
+
+        future = loop.create_future()
+
+        def finished_callback(runner: ansible_runner.Runner):
+            self.log.debug("finished_callback: %s", runner)
+            loop.call_soon_threadsafe(future.set_result, runner)
+
+        t, r = ansible_runner.run_async(finished_callback=finished_callback, **kwargs)
+
+        result = await future
+        # Shouldn't block since future should only return when ansible has finished
+        t.join()
+        return result
+
+
+class RemoteExecutor(Executor):
+    """
+    Send Ansible jobs to remote workers (see ansiblespawner.worker) and stream
+    the events back.
+
+    Each job goes to the least loaded worker, counting the jobs in flight from
+    this process and the jobs from other processes the worker reported when
+    it was last contacted. If a worker reports it is at capacity or cannot be
+    reached the next worker is tried.
+    """
+
+    # Jobs in flight from this process for each worker, shared by all spawners
+    _inflight: DictT[str, int] = {}
+    # (jobs from other processes, max_jobs) reported by each worker's last hello
+    _reported: DictT[str, TupleT[int, int]] = {}
+
+    _ssl: OptionalT[ssl.SSLContext] = None
+
+    # ansible_runner.run_async arguments that are forwarded to workers
+    job_options = ("extravars", "quiet", "envvars", "cmdline", "forks", "limit")
+
+    workers = List(
+        Unicode(),
+        config=True,
+        help="""
+        Worker addresses, either "host:port" or "unix:/path/to/socket".
+
+        Jobs include secrets such as each user's JupyterHub API token so are
+        only sent unencrypted to Unix sockets and loopback addresses. Other
+        workers must use TLS, see ssl_ca_file.
+        """,
+    )
+
+    ssl_ca_file = Unicode(
+        config=True,
+        help="""
+        CA certificate used to verify the workers' TLS certificates. If set
+        connections to "host:port" workers use TLS, this is required for
+        workers that aren't on a loopback address.
+        """,
+    )
+
+    ssl_cert_file = Unicode(
+        config=True,
+        help="""
+        Optional client certificate for workers that require one.
+        """,
+    )
+
+    ssl_key_file = Unicode(
+        config=True,
+        help="""
+        Private key for ssl_cert_file.
+        """,
+    )
+
+    secret = Unicode(
+        config=True,
+        help="""
+        Secret shared with the workers, used to authenticate each connection.
+        """,
+    )
+
+    connect_timeout = Float(
+        10,
+        config=True,
+        help="""
+        Timeout in seconds for connecting and authenticating to a worker.
+        """,
+    )
+
+    def _load(self, address: str) -> float:
+        others, max_jobs = self._reported.get(address, (0, 1))
+        if max_jobs <= 0:
+            return float("inf")
+        return (others + self._inflight.get(address, 0)) / max_jobs
+
+    def _candidates(self) -> ListT[str]:
+        # sorted is stable so ties are broken by configured order
+        return sorted(self.workers, key=self._load)
+
+    def _ssl_context(self) -> OptionalT[ssl.SSLContext]:
+        if not self.ssl_ca_file:
+            return None
+        if self._ssl is None:
+            self._ssl = ssl.create_default_context(cafile=self.ssl_ca_file)
+            if self.ssl_cert_file:
+                self._ssl.load_cert_chain(self.ssl_cert_file, self.ssl_key_file or None)
+        return self._ssl
+
+    async def _connect(self, address: str):
+        ssl_context = self._ssl_context()
+        if ssl_context is None and not is_local_address(address):
+            raise WorkerError(f"Worker {address} isn't local, TLS is required")
+        reader, writer = await open_connection(address, ssl_context)
+        try:
+            hello = await recv_message(reader)
+            load = hello.get("load", 0)
+            self._reported[address] = (
+                max(load - self._inflight.get(address, 0), 0),
+                hello.get("max_jobs", 1),
+            )
+            if load >= hello.get("max_jobs", 1):
+                raise WorkerError(f"Worker {address} is busy")
+            await send_message(
+                writer,
+                {"type": "auth", "digest": auth_digest(self.secret, hello["nonce"])},
+            )
+            reply = await recv_message(reader)
+            if reply.get("type") != "ready":
+                raise WorkerError(f"Worker {address}: {reply.get('message')}")
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    def _job(self, kwargs: JsonT) -> JsonT:
+        inventory = kwargs.get("inventory")
+        if isinstance(inventory, str):
+            with open(inventory) as f:
+                inventory = (os.path.basename(inventory), f.read())
+        options = {k: kwargs[k] for k in self.job_options if kwargs.get(k) is not None}
+        job = {
+            "playbook": kwargs["playbook"],
+            "inventory": inventory,
+            "options": options,
+        }
+        # The local ansible.cfg path doesn't exist on the worker so send the content
+        envvars = dict(options.get("envvars") or {})
+        ansible_cfg = envvars.pop("ANSIBLE_CONFIG", None)
+        if ansible_cfg:
+            with open(ansible_cfg) as f:
+                job["ansible_cfg"] = f.read()
+            options["envvars"] = envvars
+        return job
+
+    async def run(self, loop: asyncio.AbstractEventLoop, **kwargs) -> RunResult:
+        if not self.workers:
+            raise WorkerError("No workers configured")
+        job = self._job(kwargs)
+        event_handler = kwargs.get("event_handler")
+        status_handler = kwargs.get("status_handler")
+
+        errors = []
+        for address in self._candidates():
+            try:
+                reader, writer = await asyncio.wait_for(
+                    self._connect(address), self.connect_timeout
+                )
+            except (OSError, WorkerError, asyncio.TimeoutError) as e:
+                self.log.warning("Skipping worker %s: %s", address, e)
+                errors.append(f"{address}: {e}")
+                continue
+
+            self._inflight[address] = self._inflight.get(address, 0) + 1
+            try:
+                self.log.debug("Sending job to worker %s", address)
+                await send_message(writer, {"type": "job", "job": job})
+                return await self._receive(reader, event_handler, status_handler)
+            finally:
+                self._inflight[address] -= 1
+                writer.close()
+
+        raise WorkerError(f"No worker available: {errors}")
+
+    async def _receive(self, reader, event_handler, status_handler) -> RunResult:
+        events = []
+        while True:
+            message = await recv_message(reader)
+            t = message.get("type")
+            if t == "event":
+                e = message["event"]
+                if event_handler is None or event_handler(e):
+                    events.append(e)
+            elif t == "status":
+                if status_handler:
+                    status_handler(message["status"], None)
+            elif t == "result":
+                return RunResult(
+                    message["rc"], message["status"], message["stats"], events
+                )
+            else:
+                raise WorkerError(message.get("message", f"Unexpected message {t}"))
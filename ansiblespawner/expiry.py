@@ -0,0 +1,52 @@
+"""
+Process-wide expiry timers for servers that are not running
+"""
+
+import asyncio
+import logging
+
+from typing import (
+    Awaitable as AwaitableT,
+    Callable as CallableT,
+    Dict as DictT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Timer key: handle
+_timers: DictT[str, asyncio.TimerHandle] = {}
+
+
+def schedule_expiry(
+    key: str, delay: float, callback: CallableT[[], AwaitableT[None]]
+) -> bool:
+    """
+    Run `callback` after `delay` seconds, replacing any timer with the same key.
+
+    JupyterHub discards a spawner when its server stops and creates a new one
+    when the user returns, so timers are keyed by server instead of belonging
+    to a spawner. The new spawner replaces or cancels the old spawner's timer.
+
+    key: Timer key, e.g. the server key and the kind of expiry
+    delay: Seconds until the callback is run
+    callback: Async callable
+    Returns False if there's no running event loop
+    """
+    cancel_expiry(key)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    _timers[key] = loop.call_later(max(delay, 0), _fire, key, callback)
+    return True
+
+
+def cancel_expiry(key: str) -> None:
+    handle = _timers.pop(key, None)
+    if handle:
+        handle.cancel()
+
+
+def _fire(key: str, callback: CallableT[[], AwaitableT[None]]) -> None:
+    _timers.pop(key, None)
+    asyncio.ensure_future(callback())
@@ -0,0 +1,77 @@
+"""
+Lifecycle state and single-flight operations for one spawner
+"""
+
+import asyncio
+from functools import partial
+import logging
+
+from typing import (
+    Any as AnyT,
+    Awaitable as AwaitableT,
+    Callable as CallableT,
+    Dict as DictT,
+    Optional as OptionalT,
+)
+
+logger = logging.getLogger(__name__)
+
+STATES = ("idle", "creating", "updating", "running", "stopping")
+
+# States where an operation is changing the server
+TRANSITIONS = ("creating", "updating", "stopping")
+
+
+class Lifecycle:
+    """
+    The lifecycle state of a spawner's server and its operations in flight.
+
+    Calls to `run` for an operation that is already in flight wait for and
+    share the result of that run. Different operations are run one at a time
+    in the order they were requested.
+    """
+
+    def __init__(self, state: str = "idle"):
+        self.state = ""
+        self.transition(state)
+        self._lock: OptionalT[asyncio.Lock] = None
+        self._inflight: DictT[str, asyncio.Future] = {}
+
+    def transition(self, state: str) -> None:
+        if state not in STATES:
+            raise ValueError(f"Invalid lifecycle state {state}")
+        if state != self.state:
+            logger.debug("Lifecycle %s -> %s", self.state, state)
+        self.state = state
+
+    @property
+    def in_transition(self) -> bool:
+        return self.state in TRANSITIONS
+
+    async def run(
+        self, operation: str, func: CallableT[..., AwaitableT[AnyT]], *args
+    ) -> AnyT:
+        """
+        Run `func(*args)` for an operation, or wait for the run in flight.
+        A caller that is cancelled doesn't cancel the shared run.
+        """
+        future = self._inflight.get(operation)
+        if future is None:
+            future = asyncio.ensure_future(self._run(func, *args))
+            self._inflight[operation] = future
+            future.add_done_callback(partial(self._done, operation))
+        return await asyncio.shield(future)
+
+    async def _run(self, func: CallableT[..., AwaitableT[AnyT]], *args) -> AnyT:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await func(*args)
+
+    def _done(self, operation: str, future: asyncio.Future) -> None:
+        if self._inflight.get(operation) is future:
+            del self._inflight[operation]
+        if not future.cancelled():
+            # Callers may have been cancelled, don't warn about an unretrieved
+            # exception
+            future.exception()
@@ -0,0 +1,160 @@
+"""
+Place singleuser servers on a shared pool of hosts
+"""
+
+import json
+import threading
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+_pools: DictT[str, "HostPool"] = {}
+_pools_lock = threading.Lock()
+
+POLICIES = ("best-fit", "first-fit", "spread")
+
+
+class PlacementError(Exception):
+    """
+    No host has enough free capacity for a server
+    """
+
+
+class HostPool:
+    """
+    Track the capacity of a pool of hosts and the servers placed on them.
+
+    Capacities and requests are dictionaries of resource name to amount, for
+    example {"cpu": 2, "memory": 4096}. Resources that are missing from a
+    host's capacity are not limited.
+
+    Policies:
+      - best-fit: the host with the least free capacity remaining after
+        placement, packing servers onto as few hosts as possible
+      - first-fit: the first host in configuration order with enough capacity
+      - spread: the host with the most free capacity remaining
+    """
+
+    def __init__(self, hosts: DictT[str, JsonT], policy: str = "best-fit"):
+        """
+        hosts: Dictionary of host name to {"capacity": {...}, "vars": {...}}
+        policy: Placement policy
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid placement policy {policy}")
+        self.hosts = hosts
+        self.policy = policy
+        self._lock = threading.Lock()
+        # Server key: (host, resources)
+        self._allocations: DictT[str, TupleT[str, DictT[str, float]]] = {}
+
+    def used(self, host: str) -> DictT[str, float]:
+        used: DictT[str, float] = {}
+        for h, resources in self._allocations.values():
+            if h == host:
+                for k, v in resources.items():
+                    used[k] = used.get(k, 0) + v
+        return used
+
+    def free(self, host: str) -> DictT[str, float]:
+        """
+        Free capacity of the limited resources on a host
+        """
+        used = self.used(host)
+        return {
+            k: v - used.get(k, 0)
+            for k, v in self.hosts[host].get("capacity", {}).items()
+        }
+
+    def _slack(self, host: str, request: DictT[str, float]) -> OptionalT[float]:
+        """
+        Fraction of the host's capacity that would remain free after placing
+        the request, averaged over its resources, or None if it doesn't fit
+        """
+        capacity = self.hosts[host].get("capacity", {})
+        free = self.free(host)
+        fractions = []
+        for k, v in request.items():
+            if k in free and free[k] < v:
+                return None
+        for k, total in capacity.items():
+            remaining = free[k] - request.get(k, 0)
+            fractions.append(remaining / total if total > 0 else 0)
+        return sum(fractions) / len(fractions) if fractions else 0
+
+    def _choose(self, request: DictT[str, float]) -> OptionalT[str]:
+        candidates: ListT[TupleT[float, int, str]] = []
+        for n, host in enumerate(self.hosts):
+            slack = self._slack(host, request)
+            if slack is None:
+                continue
+            if self.policy == "first-fit":
+                return host
+            candidates.append((slack if self.policy == "best-fit" else -slack, n, host))
+        if not candidates:
+            return None
+        return min(candidates)[2]
+
+    def placement(self, key: str) -> OptionalT[JsonT]:
+        with self._lock:
+            if key not in self._allocations:
+                return None
+            host, resources = self._allocations[key]
+            return self._placement(host, resources)
+
+    def _placement(self, host: str, resources: DictT[str, float]) -> JsonT:
+        return {
+            "host": host,
+            "resources": resources,
+            "vars": self.hosts[host].get("vars", {}),
+        }
+
+    def allocate(self, key: str, request: DictT[str, float]) -> JsonT:
+        """
+        Place a server, or return its existing placement
+        key: Unique key for the server
+        request: Resources required by the server
+        Returns {"host": name, "resources": request, "vars": host vars}
+        """
+        with self._lock:
+            if key in self._allocations:
+                return self._placement(*self._allocations[key])
+            host = self._choose(request)
+            if host is None:
+                raise PlacementError(f"No host has capacity for {request}")
+            self._allocations[key] = (host, dict(request))
+            return self._placement(host, request)
+
+    def restore(self, key: str, placement: JsonT) -> None:
+        """
+        Record an existing placement, e.g. loaded from state after a restart.
+        Capacity is not checked.
+        """
+        with self._lock:
+            if placement.get("host") in self.hosts:
+                self._allocations[key] = (
+                    placement["host"],
+                    dict(placement.get("resources", {})),
+                )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._allocations.pop(key, None)
+
+
+def get_host_pool(hosts: DictT[str, JsonT], policy: str) -> HostPool:
+    """
+    Get a process-wide HostPool for a host configuration
+    """
+    key = json.dumps([hosts, policy], sort_keys=True)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = HostPool(hosts, policy)
+        return _pools[key]
@@ -0,0 +1,185 @@
+"""
+Adaptive token-bucket rate limits shared by all spawners
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    Iterable as IterableT,
+    List as ListT,
+    Optional as OptionalT,
+    Tuple as TupleT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+_limiters: DictT[str, "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+
+# Error messages from cloud providers when a client is throttled
+THROTTLE_PATTERNS = [
+    "RequestLimitExceeded",
+    "Throttling",
+    "TooManyRequests",
+    "Too Many Requests",
+    "Rate exceeded",
+    "RateLimitExceeded",
+    "SlowDown",
+]
+
+# Events that may contain a throttling error
+_ERROR_EVENTS = ("runner_on_failed", "runner_on_unreachable", "runner_retry")
+
+
+class TokenBucket:
+    """
+    Token bucket with an additive-increase, multiplicative-decrease rate.
+
+    Tokens are added at `rate` per second up to `burst`. When throttling is
+    reported the rate is multiplied by `decrease` (not below `min_rate`) and
+    the bucket is emptied. Each run that isn't throttled adds `increase` to the
+    rate, up to `max_rate`.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        min_rate: OptionalT[float] = None,
+        increase: OptionalT[float] = None,
+        decrease: float = 0.5,
+    ):
+        """
+        rate: Maximum tokens per second
+        burst: Maximum number of tokens
+        min_rate: Minimum tokens per second after throttling, default rate / 10
+        increase: Tokens per second added after each successful run, default
+          rate / 10
+        decrease: Factor applied to the rate after throttling
+        """
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.increase = increase if increase is not None else rate / 10
+        self.decrease = decrease
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock: OptionalT[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """
+        Wait until `tokens` are available and take them. Waiters are admitted
+        in order. Costs larger than the burst, e.g. a batch, are taken as the
+        tokens are added.
+        Returns the number of seconds waited
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return time.monotonic() - start
+                if tokens > self.burst:
+                    tokens -= self.tokens
+                    self.tokens = 0
+                await asyncio.sleep((min(tokens, self.burst) - self.tokens) / self.rate)
+
+    def throttled(self) -> None:
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = 0
+
+    def succeeded(self) -> None:
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class RateLimiter:
+    """
+    A set of named token buckets, one per cloud API budget
+    """
+
+    def __init__(self, limits: DictT[str, JsonT]):
+        """
+        limits: Dictionary of budget name to TokenBucket arguments, e.g.
+          {"ec2": {"rate": 2, "burst": 10}}
+        """
+        self.buckets = {name: TokenBucket(**args) for name, args in limits.items()}
+
+    def _buckets(self, budgets: IterableT[str]) -> ListT[TupleT[str, TokenBucket]]:
+        return [(b, self.buckets[b]) for b in sorted(budgets) if b in self.buckets]
+
+    async def acquire(self, costs: DictT[str, float]) -> float:
+        """
+        Take tokens from each budget, in name order so concurrent callers
+        can't deadlock
+        costs: Dictionary of budget name to tokens
+        Returns the number of seconds waited
+        """
+        waited = 0.0
+        for name, bucket in self._buckets(costs):
+            waited += await bucket.acquire(costs[name])
+        return waited
+
+    def report(self, budgets: IterableT[str], throttled: bool) -> None:
+        """
+        Adapt the rate of each budget after a run
+        """
+        for name, bucket in self._buckets(budgets):
+            if throttled:
+                bucket.throttled()
+                logger.warning(
+                    "Throttled by %s, reducing rate to %.3g/s", name, bucket.rate
+                )
+            else:
+                bucket.succeeded()
+
+
+def is_throttled(events: IterableT[JsonT], patterns: IterableT[str]) -> bool:
+    """
+    Whether any Ansible failure or retry event matches a throttling pattern
+    """
+    patterns = list(patterns)
+    if not patterns:
+        return False
+    regex = re.compile("|".join(f"(?:{p})" for p in patterns))
+    for e in events:
+        if e.get("event") not in _ERROR_EVENTS:
+            continue
+        text = e.get("stdout", "") + json.dumps(
+            e.get("event_data", {}).get("res", {}), default=str
+        )
+        if regex.search(text):
+            return True
+    return False
+
+
+def get_rate_limiter(limits: DictT[str, JsonT]) -> RateLimiter:
+    """
+    Get a process-wide RateLimiter so all spawners share the same budgets
+    """
+    key = json.dumps(limits, sort_keys=True)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(limits)
+        return _limiters[key]
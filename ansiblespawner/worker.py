@@ -0,0 +1,333 @@
+"""
+Remote Ansible worker process
+
+Workers run Ansible jobs sent by a RemoteExecutor in the JupyterHub process
+and stream the Ansible events back.
+
+The protocol is newline delimited JSON over TCP or a Unix socket:
+
+    worker: {"type": "hello", "nonce": ..., "load": ..., "max_jobs": ...}
+    client: {"type": "auth", "digest": HMAC-SHA256(secret, nonce)}
+    worker: {"type": "ready"} or {"type": "error", "message": ...}
+    client: {"type": "job", "job": {...}}
+    worker: {"type": "event", "event": {...}} (repeated)
+    worker: {"type": "status", "status": {...}} (repeated)
+    worker: {"type": "result", "rc": ..., "status": ..., "stats": ...}
+
+Run a worker with `python -m ansiblespawner.worker --listen HOST:PORT`.
+Playbooks are referenced by path so must be available at the same location on
+every worker.
+
+Jobs contain secrets such as each user's JupyterHub API token, the shared
+secret only authenticates the connection. Connections are only unencrypted on
+Unix sockets and loopback addresses, other addresses require TLS: start the
+worker with `--certfile` and `--keyfile` (and optionally `--client-cafile` to
+require client certificates) and configure `RemoteExecutor.ssl_ca_file`.
+"""
+
+import ansible_runner
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import ssl
+import tempfile
+
+from typing import (
+    Any as AnyT,
+    Dict as DictT,
+    Optional as OptionalT,
+)
+
+JsonT = DictT[str, AnyT]
+
+logger = logging.getLogger(__name__)
+
+# Ansible events can be large, the asyncio default is 64 KiB
+STREAM_LIMIT = 64 * 1024 * 1024
+
+SECRET_ENV = "ANSIBLESPAWNER_WORKER_SECRET"
+
+
+class WorkerError(Exception):
+    """
+    A worker rejected a job or the connection to a worker failed
+    """
+
+
+def auth_digest(secret: str, nonce: str) -> str:
+    return hmac.new(secret.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+
+def parse_address(address: str) -> JsonT:
+    """
+    Convert "host:port" or "unix:/path" to keyword arguments for
+    asyncio.open_connection/start_server or the unix socket equivalents
+    """
+    if address.startswith("unix:"):
+        return {"path": address[5:]}
+    host, _, port = address.rpartition(":")
+    return {"host": host.strip("[]"), "port": int(port)}
+
+
+def is_local_address(address: str) -> bool:
+    """
+    Whether an address is a Unix socket or a loopback address, so traffic
+    can't be read from the network
+    """
+    kwargs = parse_address(address)
+    if "path" in kwargs:
+        return True
+    if kwargs["host"] == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(kwargs["host"]).is_loopback
+    except ValueError:
+        return False
+
+
+def server_ssl_context(
+    certfile: str, keyfile: OptionalT[str] = None, cafile: OptionalT[str] = None
+) -> ssl.SSLContext:
+    """
+    TLS context for a worker
+    certfile, keyfile: The worker's certificate and private key
+    cafile: If set clients must have a certificate signed by this CA
+    """
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    if cafile:
+        context.load_verify_locations(cafile)
+        context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
+
+async def open_connection(address: str, ssl_context: OptionalT[ssl.SSLContext] = None):
+    kwargs = parse_address(address)
+    if "path" in kwargs:
+        return await asyncio.open_unix_connection(limit=STREAM_LIMIT, **kwargs)
+    return await asyncio.open_connection(limit=STREAM_LIMIT, ssl=ssl_context, **kwargs)
+
+
+async def send_message(writer: asyncio.StreamWriter, message: JsonT) -> None:
+    writer.write(json.dumps(message, default=str).encode() + b"\n")
+    await writer.drain()
+
+
+async def recv_message(reader: asyncio.StreamReader) -> JsonT:
+    line = await reader.readline()
+    if not line:
+        raise WorkerError("Connection closed")
+    return json.loads(line)
+
+
+class AnsibleWorker:
+    """
+    Accept authenticated connections and run one Ansible job per connection
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        max_jobs: int = 4,
+        ssl_context: OptionalT[ssl.SSLContext] = None,
+    ):
+        """
+        secret: Shared secret used to authenticate clients
+        max_jobs: Maximum number of concurrent jobs, further jobs are rejected
+        ssl_context: TLS context, required to listen on a non-loopback address
+        """
+        if not secret:
+            raise ValueError("A worker secret is required")
+        self.secret = secret
+        self.max_jobs = max_jobs
+        self.ssl_context = ssl_context
+        self.load = 0
+        self.server: OptionalT[asyncio.AbstractServer] = None
+
+    async def start(self, address: str) -> asyncio.AbstractServer:
+        if self.ssl_context is None and not is_local_address(address):
+            raise ValueError(f"TLS is required to listen on {address}")
+        kwargs = parse_address(address)
+        if "path" in kwargs:
+            self.server = await asyncio.start_unix_server(
+                self.handle, limit=STREAM_LIMIT, **kwargs
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle, limit=STREAM_LIMIT, ssl=self.ssl_context, **kwargs
+            )
+        return self.server
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            nonce = secrets.token_hex(16)
+            await send_message(
+                writer,
+                {
+                    "type": "hello",
+                    "nonce": nonce,
+                    "load": self.load,
+                    "max_jobs": self.max_jobs,
+                },
+            )
+            auth = await recv_message(reader)
+            if auth.get("type") != "auth" or not hmac.compare_digest(
+                str(auth.get("digest", "")), auth_digest(self.secret, nonce)
+            ):
+                logger.warning("Worker authentication failed")
+                await send_message(
+                    writer, {"type": "error", "message": "Authentication failed"}
+                )
+                return
+            if self.load >= self.max_jobs:
+                await send_message(writer, {"type": "error", "message": "Busy"})
+                return
+            # Reserve the slot before replying so concurrent clients can't all
+            # be told this worker is ready
+            self.load += 1
+            try:
+                await send_message(writer, {"type": "ready"})
+                message = await recv_message(reader)
+                if message.get("type") != "job":
+                    await send_message(
+                        writer, {"type": "error", "message": "Expected a job"}
+                    )
+                    return
+                await self.run_job(message["job"], writer)
+            finally:
+                self.load -= 1
+        except (WorkerError, ConnectionError) as e:
+            # Clients disconnect after the hello if this worker is too busy
+            logger.debug("Worker connection closed: %s", e)
+        except Exception:
+            logger.exception("Worker job failed")
+            try:
+                await send_message(
+                    writer, {"type": "error", "message": "Internal worker error"}
+                )
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def run_job(self, job: JsonT, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue = asyncio.Queue()
+
+        def event_handler(e: JsonT) -> bool:
+            loop.call_soon_threadsafe(
+                messages.put_nowait, {"type": "event", "event": e}
+            )
+            return True
+
+        def status_handler(s: JsonT, runner_config) -> bool:
+            loop.call_soon_threadsafe(
+                messages.put_nowait, {"type": "status", "status": s}
+            )
+            return True
+
+        def finished_callback(runner: ansible_runner.Runner):
+            loop.call_soon_threadsafe(messages.put_nowait, None)
+
+        with tempfile.TemporaryDirectory(prefix="ansiblespawner-worker-") as tmpdir:
+            kwargs = dict(job.get("options", {}))
+            inventory = job.get("inventory")
+            if isinstance(inventory, dict):
+                kwargs["inventory"] = inventory
+            elif inventory:
+                filename, content = inventory
+                inventory_file = os.path.join(tmpdir, os.path.basename(filename))
+                with open(inventory_file, "w") as f:
+                    f.write(content)
+                kwargs["inventory"] = inventory_file
+            if job.get("ansible_cfg"):
+                ansible_cfg = os.path.join(tmpdir, "ansible.cfg")
+                with open(ansible_cfg, "w") as f:
+                    f.write(job["ansible_cfg"])
+                envvars = dict(kwargs.get("envvars") or {})
+                envvars["ANSIBLE_CONFIG"] = ansible_cfg
+                kwargs["envvars"] = envvars
+
+            t, r = ansible_runner.run_async(
+                private_data_dir=tmpdir,
+                playbook=job["playbook"],
+                event_handler=event_handler,
+                status_handler=status_handler,
+                finished_callback=finished_callback,
+                **kwargs,
+            )
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                await send_message(writer, message)
+            await loop.run_in_executor(None, t.join)
+            # Events may be queued after the finished callback
+            while not messages.empty():
+                message = messages.get_nowait()
+                if message is not None:
+                    await send_message(writer, message)
+            await send_message(
+                writer,
+                {"type": "result", "rc": r.rc, "status": r.status, "stats": r.stats},
+            )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="AnsibleSpawner remote worker")
+    parser.add_argument(
+        "--listen",
+        default="127.0.0.1:9736",
+        help="Address to listen on, HOST:PORT or unix:/path",
+    )
+    parser.add_argument(
+        "--secret-file",
+        help=f"File containing the shared secret, default is ${SECRET_ENV}",
+    )
+    parser.add_argument(
+        "--max-jobs", type=int, default=4, help="Maximum number of concurrent jobs"
+    )
+    parser.add_argument(
+        "--certfile",
+        help="TLS certificate, required to listen on a non-loopback address",
+    )
+    parser.add_argument("--keyfile", help="TLS private key")
+    parser.add_argument(
+        "--client-cafile", help="Require client certificates signed by this CA"
+    )
+    parser.add_argument("--debug", action="store_true", help="Debug logging")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    if args.secret_file:
+        with open(args.secret_file) as f:
+            secret = f.read().strip()
+    else:
+        secret = os.getenv(SECRET_ENV, "")
+
+    ssl_context = None
+    if args.certfile:
+        ssl_context = server_ssl_context(
+            args.certfile, args.keyfile, args.client_cafile
+        )
+
+    async def serve():
+        worker = AnsibleWorker(secret, max_jobs=args.max_jobs, ssl_context=ssl_context)
+        server = await worker.start(args.listen)
+        logger.info("Listening on %s", args.listen)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
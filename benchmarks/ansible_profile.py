@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Compare the latency of each AnsibleSpawner operation with different execution
+profiles.
+
+    python benchmarks/ansible_profile.py --runs 5
+    python benchmarks/ansible_profile.py --inventory hosts.yml --profiles default fast
+
+Each run creates, polls and destroys a server with the create.yml, poll.yml and
+destroy.yml playbooks in this directory. The default inventory uses the local
+connection so SSH pipelining and connection reuse have no effect, use an
+inventory of SSH hosts to measure them (see README.md).
+"""
+
+import argparse
+import asyncio
+from collections import namedtuple
+import os
+import statistics
+import time
+import yaml
+
+from ansiblespawner import AnsibleSpawner
+from ansiblespawner.ansiblecfg import PROFILES
+
+benchmark_dir = os.path.abspath(os.path.dirname(__file__))
+
+OPERATIONS = ("create", "poll", "destroy")
+
+LOCAL_INVENTORY = {
+    "all": {
+        "hosts": {
+            "localhost": {
+                "ansible_connection": "local",
+                "ansible_python_interpreter": "{{ ansible_playbook_python }}",
+            }
+        }
+    }
+}
+
+
+async def run_profile(profile, inventory, runs):
+    """
+    Returns a dictionary of operation to a list of durations
+    """
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("benchmark", "benchmark")
+    a.execution_profile = profile
+    loop = asyncio.get_running_loop()
+    durations = {op: [] for op in OPERATIONS}
+    for _ in range(runs):
+        for op in OPERATIONS:
+            start = time.perf_counter()
+            r = await a.run_ansible(
+                loop,
+                inventory=inventory,
+                playbook=os.path.join(benchmark_dir, f"{op}.yml"),
+                operation=op,
+            )
+            durations[op].append(time.perf_counter() - start)
+            r["tmpdir"].cleanup()
+    return durations
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per profile")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(PROFILES),
+        choices=list(PROFILES),
+        help="Execution profiles to compare, the first is the baseline",
+    )
+    parser.add_argument("--inventory", help="YAML inventory, default localhost")
+    args = parser.parse_args(argv)
+
+    inventory = LOCAL_INVENTORY
+    if args.inventory:
+        with open(args.inventory) as f:
+            inventory = yaml.safe_load(f)
+
+    print(
+        f"{'profile':<10} {'operation':<10} {'mean':>8} {'median':>8} "
+        f"{'min':>8} {'max':>8}"
+    )
+    baseline = None
+    for profile in args.profiles:
+        durations = await run_profile(profile, inventory, args.runs)
+        means = {op: statistics.mean(d) for op, d in durations.items()}
+        if baseline is None:
+            baseline = means
+        for op in OPERATIONS:
+            d = durations[op]
+            change = 100 * (means[op] - baseline[op]) / baseline[op]
+            print(
+                f"{profile:<10} {op:<10} {means[op]:8.2f} "
+                f"{statistics.median(d):8.2f} {min(d):8.2f} {max(d):8.2f} "
+                f"({change:+.0f}%)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,6 +13,12 @@ c.AnsibleSpawner.poll_playbook = ansible_path + "poll.yml"
 
 c.AnsibleSpawner.destroy_playbook = ansible_path + "destroy.yml"
 
+# Stop instead of terminating instances when servers are stopped, and
+# terminate them if the user doesn't return within a day
+# c.AnsibleSpawner.suspend_playbook = ansible_path + "suspend.yml"
+# c.AnsibleSpawner.resume_playbook = ansible_path + "resume.yml"
+# c.AnsibleSpawner.suspended_lifetime = 86400
+
 c.AnsibleSpawner.playbook_vars = {
     "ansible_srcdir": ansible_path,
     # These will be substituted when this file is copied in jupyterhub-deploy.yml
@@ -21,6 +27,16 @@ c.AnsibleSpawner.playbook_vars = {
 }
 c.AnsibleSpawner.start_timeout = 600
 c.AnsibleSpawner.keep_temp_dirs = True
+# Archive Ansible run directories with size and age limits instead
+# c.AnsibleSpawner.artifact_dir = "/var/lib/jupyterhub/ansible-artifacts"
+# c.AnsibleSpawner.artifact_keep = "failed"
+# Limit EC2 API calls across all users, reduced automatically when throttled
+# c.AnsibleSpawner.rate_limits = {"ec2": {"rate": 2, "burst": 10}}
+# c.AnsibleSpawner.rate_limit_costs = {
+#     "create": {"ec2": 5},
+#     "poll": {"ec2": 1},
+#     "destroy": {"ec2": 2},
+# }
 
 c.JupyterHub.authenticator_class = "dummy"
 c.JupyterHub.hub_connect_ip = local_ip
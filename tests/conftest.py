@@ -1,15 +1,20 @@
 """ pytest config for ansiblespawner tests """
 
 # https://github.com/jupyterhub/yarnspawner/blob/0.4.0/yarnspawner/tests/conftest.py
+import asyncio
+from collections import namedtuple
+import pytest
 import pytest_asyncio
 
+from jupyterhub.app import JupyterHub
 from jupyterhub.tests.mocking import MockHub
 import os
 import socket
 import sys
 from traitlets.config import Config
+from types import SimpleNamespace
 
-from ansiblespawner import AnsibleSpawner
+from ansiblespawner import AnsibleSpawner, AnsibleException
 
 
 # make Hub connectable by default
@@ -81,3 +86,110 @@ async def app(request):
             mocked_app.stop()
         except Exception as e:
             print("Error stopping Hub: %s" % e, file=sys.stderr)
+
+
+class FakeRunner:
+    rc = 2
+    status = "failed"
+    stats = None
+    events = []
+
+
+@pytest.fixture
+def fake_ansible_spawner(monkeypatch):
+    """
+    Factory for spawners that don't run Ansible
+
+    run_ansible returns outputs[operation] as "ansiblespawner_out", or raises
+    AnsibleException if the operation is in failures. If events[operation] is
+    set those events are passed to the event_handler.
+    Returns the spawner and a list of (operation, serverinfo) for each run.
+    """
+
+    def factory(outputs, failures=(), events=None):
+        a = AnsibleSpawner()
+        User = namedtuple("User", ["escaped_name", "name"])
+        a.user = User("user", "user")
+        a.resumable_start = True
+        a.create_playbook = "create.yml"
+        a.update_playbook = "update.yml"
+        a.poll_playbook = "poll.yml"
+        a.destroy_playbook = "destroy.yml"
+        calls = []
+
+        def _render_inventory(args):
+            return {}
+
+        async def _get_extravars():
+            return {"serverinfo": a.serverinfo or {}}
+
+        async def run_ansible(loop, inventory, operation=None, **kwargs):
+            calls.append((operation, dict(kwargs["extravars"]["serverinfo"])))
+            run_events = (events or {}).get(operation, [])
+            for e in run_events:
+                if "event_handler" in kwargs:
+                    kwargs["event_handler"](e)
+            # Let the event loop process callbacks from the event_handler
+            await asyncio.sleep(0)
+            if operation in failures:
+                raise AnsibleException("Non-zero exit code", FakeRunner())
+            return {
+                "ansiblespawner_out": outputs.get(operation),
+                "events": run_events,
+                "tmpdir": None,
+            }
+
+        monkeypatch.setattr(a, "_render_inventory", _render_inventory)
+        monkeypatch.setattr(a, "_get_extravars", _get_extravars)
+        monkeypatch.setattr(a, "run_ansible", run_ansible)
+        monkeypatch.setattr(a, "_cleanup_tmpdir", lambda tmpdir: None)
+        return a, calls
+
+    return factory
+
+
+class _SpawnerDict(dict):
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __missing__(self, name):
+        self[name] = self.factory(name)
+        return self[name]
+
+
+@pytest.fixture
+def fake_restarted_hub(monkeypatch):
+    """
+    Factory that makes JupyterHub.instance() a hub that has just restarted, so
+    no spawners have been created
+
+    states: Dictionary of server name to the saved state of one user's servers
+    make_spawner: Callable returning (spawner, calls), e.g. from
+      fake_ansible_spawner
+    Returns a dictionary of server name to the calls of each spawner the hub
+    creates
+    """
+
+    def factory(states, make_spawner):
+        orm_user = namedtuple("OrmUser", ["name"])("user")
+        created = {}
+
+        def new_spawner(name):
+            spawner, calls = make_spawner()
+            spawner.load_state(states[name])
+            created[name] = calls
+            return spawner
+
+        orm_spawners = [
+            SimpleNamespace(user=orm_user, name=name, state=state)
+            for name, state in states.items()
+        ]
+        app = SimpleNamespace(
+            db=SimpleNamespace(query=lambda cls: orm_spawners),
+            users={orm_user: SimpleNamespace(spawners=_SpawnerDict(new_spawner))},
+        )
+        monkeypatch.setattr(JupyterHub, "initialized", lambda: True)
+        monkeypatch.setattr(JupyterHub, "instance", lambda: app)
+        return created
+
+    return factory
@@ -0,0 +1,166 @@
+"""Unit tests for generated Ansible configuration"""
+
+import asyncio
+from collections import namedtuple
+import configparser
+import os
+import pytest
+import yaml
+
+from ansiblespawner import AnsibleSpawner, RemoteExecutor
+from ansiblespawner import ansiblecfg
+from ansiblespawner.ansiblecfg import render_ansible_cfg
+from ansiblespawner.worker import AnsibleWorker
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.fixture(autouse=True)
+def no_ansible_cfg(monkeypatch, tmp_path):
+    # Don't pick up an ansible.cfg from the environment
+    monkeypatch.delenv("ANSIBLE_CONFIG", raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+
+def _parse(content):
+    cfg = configparser.ConfigParser(interpolation=None)
+    cfg.read_string(content)
+    return cfg
+
+
+def test_render_default():
+    assert render_ansible_cfg("default") is None
+    assert render_ansible_cfg({}) is None
+    with pytest.raises(ValueError):
+        render_ansible_cfg("unknown")
+
+
+def test_render_profile():
+    cfg = _parse(
+        render_ansible_cfg(
+            {
+                "pipelining": True,
+                "strategy": "free",
+                "forks": 30,
+                "gathering": "smart",
+                "callbacks_enabled": ["timer", "profile_tasks"],
+                "options": {"inventory": {"cache": True}},
+            }
+        )
+    )
+    assert cfg["ssh_connection"]["pipelining"] == "True"
+    assert cfg["defaults"]["strategy"] == "free"
+    assert cfg["defaults"]["forks"] == "30"
+    assert cfg["defaults"]["gathering"] == "smart"
+    assert cfg["defaults"]["callbacks_enabled"] == "timer,profile_tasks"
+    assert cfg["inventory"]["cache"] == "True"
+
+
+def test_render_base_config(tmp_path):
+    base = tmp_path / "ansible.cfg"
+    base.write_text(
+        "[defaults]\n"
+        "roles_path = ./roles:/etc/roles:~/roles\n"
+        "collections_path = collections\n"
+        "inventory = hosts.yml,localhost\n"
+        "forks = 5\n"
+        "[ssh_connection]\n"
+        "control_path = %(directory)s/%%h\n"
+    )
+    cfg = _parse(render_ansible_cfg({"base_config": str(base), "forks": 10}))
+    assert cfg["defaults"]["roles_path"] == f"{tmp_path}/roles:/etc/roles:~/roles"
+    assert cfg["defaults"]["collections_path"] == f"{tmp_path}/collections"
+    assert cfg["defaults"]["inventory"] == f"{tmp_path}/hosts.yml,{tmp_path}/localhost"
+    assert cfg["defaults"]["forks"] == "10"
+    assert cfg["ssh_connection"]["control_path"] == "%(directory)s/%%h"
+
+
+def test_render_default_base_config(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "ansible.cfg").write_text("[defaults]\nroles_path = ./roles\n")
+    monkeypatch.chdir(project)
+    # The ansible.cfg Ansible would have used is extended
+    cfg = _parse(render_ansible_cfg("fast"))
+    assert cfg["defaults"]["roles_path"] == f"{project}/roles"
+    assert cfg["defaults"]["gathering"] == "explicit"
+
+    cfg = _parse(render_ansible_cfg({"base_config": None, "forks": 3}))
+    assert "roles_path" not in cfg["defaults"]
+
+    monkeypatch.setenv("ANSIBLE_CONFIG", str(tmp_path))
+    (tmp_path / "ansible.cfg").write_text("[defaults]\nlibrary = lib\n")
+    cfg = _parse(render_ansible_cfg("fast"))
+    assert cfg["defaults"]["library"] == f"{tmp_path}/lib"
+
+
+def test_render_mitogen(monkeypatch):
+    monkeypatch.setattr(ansiblecfg, "_mitogen_strategy_plugins", lambda: None)
+    cfg = _parse(render_ansible_cfg("mitogen"))
+    assert cfg["defaults"]["strategy"] == "free"
+    assert "strategy_plugins" not in cfg["defaults"]
+
+    monkeypatch.setattr(
+        ansiblecfg, "_mitogen_strategy_plugins", lambda: "/mitogen/strategy"
+    )
+    cfg = _parse(render_ansible_cfg("mitogen"))
+    assert cfg["defaults"]["strategy"] == "mitogen_free"
+    assert cfg["defaults"]["strategy_plugins"] == "/mitogen/strategy"
+
+
+def _spawner():
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("user", "user")
+    a.execution_profile = {"forks": 7, "gathering": "explicit", "strategy": "free"}
+    return a
+
+
+async def _run(a):
+    with open(os.path.join(resources_dir, "unit_inventory.yml")) as f:
+        inventory = yaml.safe_load(f)
+    r = await a.run_ansible(
+        asyncio.get_running_loop(),
+        inventory=inventory,
+        playbook=os.path.join(resources_dir, "unit_config_playbook.yml"),
+    )
+    r["tmpdir"].cleanup()
+    return r["ansiblespawner_out"]
+
+
+@pytest.mark.asyncio
+async def test_run_ansible_profile():
+    out = await _run(_spawner())
+    assert out == {"forks": 7, "gathering": "explicit", "strategy": "free"}
+
+
+@pytest.mark.asyncio
+async def test_remote_run_ansible_profile():
+    worker = AnsibleWorker("secret")
+    server = await worker.start("127.0.0.1:0")
+    port = server.sockets[0].getsockname()[1]
+    a = _spawner()
+    a.executor = RemoteExecutor(workers=[f"127.0.0.1:{port}"], secret="secret")
+    try:
+        out = await _run(a)
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert out == {"forks": 7, "gathering": "explicit", "strategy": "free"}
+
+
+def test_get_ansible_cfg_cached(monkeypatch):
+    lookups = []
+
+    def mitogen():
+        lookups.append(1)
+        return None
+
+    monkeypatch.setattr(ansiblecfg, "_mitogen_strategy_plugins", mitogen)
+    profile = {"base_config": None, "strategy": "mitogen_linear"}
+    first = ansiblecfg.get_ansible_cfg(profile)
+    assert ansiblecfg.get_ansible_cfg(dict(profile)) == first
+    assert len(lookups) == 1
+    assert "strategy = linear" in first
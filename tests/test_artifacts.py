@@ -0,0 +1,160 @@
+"""Unit tests for archived Ansible run directories"""
+
+import asyncio
+from collections import namedtuple
+import os
+import pytest
+import tarfile
+import threading
+import time
+import yaml
+
+from ansiblespawner import AnsibleSpawner, AnsibleException
+from ansiblespawner.artifacts import ArtifactStore
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def _rundir(tmp_path, name, size=10):
+    d = tmp_path / "runs" / name
+    d.mkdir(parents=True)
+    # Random content so the archive size is close to the file size
+    (d / "stdout").write_bytes(os.urandom(size))
+    return str(d)
+
+
+def _add(store, key, path, failed=False, operation="poll"):
+    store.add(
+        key,
+        path,
+        {"operation": operation, "status": "ok", "rc": 0, "failed": failed},
+    ).result(10)
+
+
+def test_add_and_index(tmp_path):
+    store = ArtifactStore(str(tmp_path / "archive"))
+    run1 = _rundir(tmp_path, "1")
+    run2 = _rundir(tmp_path, "2")
+    _add(store, "user", run1, operation="create")
+    _add(store, "user", run2, failed=True)
+
+    assert not os.path.exists(run1)
+    assert not os.path.exists(run2)
+    runs = store.runs("user")
+    assert [(r["operation"], r["failed"]) for r in runs] == [
+        ("poll", True),
+        ("create", False),
+    ]
+    assert runs[0]["archive"].endswith(".tar.gz")
+    with tarfile.open(runs[0]["archive"]) as tar:
+        assert any(n.endswith("/stdout") for n in tar.getnames())
+    assert store.runs("user", 1) == runs[:1]
+    assert store.runs("other") == []
+
+    # The index is loaded by a new store
+    assert ArtifactStore(str(tmp_path / "archive")).runs("user") == runs
+
+
+def test_keep_failed(tmp_path):
+    store = ArtifactStore(str(tmp_path / "archive"), keep="failed")
+    run1 = _rundir(tmp_path, "1")
+    run2 = _rundir(tmp_path, "2")
+    _add(store, "user", run1)
+    _add(store, "user", run2, failed=True)
+
+    runs = store.runs("user")
+    assert not os.path.exists(run1)
+    assert runs[0]["failed"] and runs[0]["archive"]
+    assert not runs[1]["failed"] and runs[1]["archive"] is None
+
+
+def test_max_bytes(tmp_path):
+    store = ArtifactStore(str(tmp_path / "archive"), max_bytes=25000)
+    for n in range(3):
+        _add(store, f"user{n}", _rundir(tmp_path, str(n), 10000))
+
+    # The oldest archive is deleted but the run is still indexed
+    assert store.runs("user0")[0]["archive"] is None
+    assert os.path.exists(store.runs("user1")[0]["archive"])
+    assert os.path.exists(store.runs("user2")[0]["archive"])
+    assert not os.listdir(tmp_path / "archive" / "user0")
+
+
+def test_max_age_and_runs(tmp_path):
+    store = ArtifactStore(str(tmp_path / "archive"), max_age=3600, max_runs=2)
+    _add(store, "old", _rundir(tmp_path, "old"))
+    archive = store.runs("old")[0]["archive"]
+    store._index["old"][0]["time"] = time.time() - 7200
+
+    for n in range(3):
+        _add(store, "user", _rundir(tmp_path, str(n)), operation=str(n))
+
+    assert store.runs("old") == []
+    assert not os.path.exists(archive)
+    assert [r["operation"] for r in store.runs("user")] == ["2", "1"]
+
+
+def test_save_once_per_batch(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path / "archive"))
+    saves = []
+    save = store._save
+    monkeypatch.setattr(store, "_save", lambda: saves.append(save()))
+
+    # Queue several runs while the archive thread is busy
+    busy = threading.Event()
+    store._executor.submit(busy.wait, 10)
+    futures = [
+        store.add(
+            "user",
+            _rundir(tmp_path, str(n)),
+            {"operation": str(n), "status": "ok", "rc": 0, "failed": False},
+        )
+        for n in range(3)
+    ]
+    busy.set()
+    for f in futures:
+        f.result(10)
+
+    assert len(saves) == 1
+    assert [r["operation"] for r in store.runs("user")] == ["2", "1", "0"]
+    assert ArtifactStore(str(tmp_path / "archive")).runs("user") == store.runs("user")
+
+
+def _spawner(artifact_dir):
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("user", "user")
+    a.artifact_dir = artifact_dir
+    return a
+
+
+@pytest.mark.asyncio
+async def test_run_ansible_archived(tmp_path):
+    a = _spawner(str(tmp_path))
+    with open(os.path.join(resources_dir, "unit_inventory.yml")) as f:
+        inventory = yaml.safe_load(f)
+
+    r = await a.run_ansible(
+        asyncio.get_running_loop(),
+        inventory=inventory,
+        playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+        operation="poll",
+    )
+    assert r["tmpdir"] is None
+    with pytest.raises(AnsibleException):
+        await a.run_ansible(
+            asyncio.get_running_loop(),
+            inventory=inventory,
+            playbook=os.path.join(resources_dir, "unit_empty_playbook.yml"),
+            operation="create",
+        )
+
+    store = a._get_artifact_store()
+    store.flush(10)
+    runs = store.runs("user")
+    assert [(r["operation"], r["failed"]) for r in runs] == [
+        ("create", True),
+        ("poll", False),
+    ]
+    assert all(os.path.exists(r["archive"]) for r in runs)
@@ -0,0 +1,135 @@
+"""Unit tests for batched starts"""
+
+import asyncio
+from collections import namedtuple
+import os
+import pytest
+
+from ansiblespawner import AnsibleSpawner, AnsibleException
+from ansiblespawner.batch import Batcher
+from ansiblespawner.eventlog import get_event_log_writer
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.mark.asyncio
+async def test_batcher():
+    batches = []
+
+    async def run(items):
+        batches.append(items)
+        return [ValueError(i) if i < 0 else i * 10 for i in items]
+
+    batcher = Batcher(window=0.1, max_size=3)
+    results = await asyncio.gather(
+        *[batcher.submit(i, run) for i in (1, 2, 3, 4, -5)],
+        return_exceptions=True,
+    )
+    assert batches == [[1, 2, 3], [4, -5]]
+    assert results[:4] == [10, 20, 30, 40]
+    assert isinstance(results[4], ValueError)
+
+
+def _spawner(monkeypatch, name, port):
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User(name, name)
+    a.create_playbook = os.path.join(resources_dir, "unit_batch_playbook.yml")
+    a.start_batch_window = 0.5
+    events = []
+
+    async def _get_inventory():
+        raise AssertionError("inventory should not be used")
+
+    async def _get_extravars():
+        return {"user": a._get_user(), "serverinfo": {}, "port": port}
+
+    def run_ansible(*args, **kwargs):
+        events.append(kwargs["operation"])
+        return AnsibleSpawner.run_ansible(a, *args, **kwargs)
+
+    monkeypatch.setattr(a, "_get_inventory", _get_inventory)
+    monkeypatch.setattr(a, "_get_extravars", _get_extravars)
+    monkeypatch.setattr(a, "run_ansible", run_ansible)
+    return a, events
+
+
+@pytest.mark.asyncio
+async def test_batched_start(monkeypatch):
+    spawners = [
+        _spawner(monkeypatch, name, 8000 + n)
+        for n, name in enumerate(["alice", "bob", "fail1"])
+    ]
+    # Don't try to get the inventory after create
+    for a, _ in spawners:
+        a.update_playbook = None
+        monkeypatch.setattr(a, "_get_inventory", lambda: asyncio.sleep(0))
+
+    results = await asyncio.gather(
+        *[a.start() for a, _ in spawners], return_exceptions=True
+    )
+
+    assert results[:2] == [("127.0.0.1", 8000), ("127.0.0.1", 8001)]
+    assert isinstance(results[2], AnsibleException)
+    assert str(results[2]).startswith("AnsibleException: Batched create failed")
+    assert spawners[0][0].serverinfo == {
+        "ip": "127.0.0.1",
+        "port": 8000,
+        "name": "alice",
+    }
+    # Only one Ansible run
+    assert [len(events) for _, events in spawners] == [1, 0, 0]
+    assert spawners[0][1] == ["create-batch"]
+
+    messages = []
+    while not spawners[0][0].events.empty():
+        messages.append(spawners[0][0].events.get_nowait())
+    assert messages[0]["message"].startswith("playbook_on_start")
+    assert messages[-1] is None
+
+
+@pytest.mark.asyncio
+async def test_run_create_batch_events(monkeypatch):
+    a, _ = _spawner(monkeypatch, "leader", 8000)
+    events = {"alice": [], "fail2": []}
+    items = [
+        {
+            "host": f"ansiblespawner-{name}",
+            "hostvars": {"user": {"name": name}, "port": 8000},
+            "event_handler": events[name].append,
+        }
+        for name in events
+    ]
+    results = await a._run_create_batch(items)
+
+    assert results[0]["ansiblespawner_out"]["name"] == "alice"
+    assert isinstance(results[1], AnsibleException)
+    for name, host_events in events.items():
+        hosts = {e["event_data"].get("host") for e in host_events}
+        assert hosts == {None, f"ansiblespawner-{name}"}
+    assert "runner_on_failed" in [e["event"] for e in events["fail2"]]
+    assert "runner_on_failed" not in [e["event"] for e in events["alice"]]
+
+
+@pytest.mark.asyncio
+async def test_run_create_batch_logged_separately(monkeypatch, tmp_path):
+    a, _ = _spawner(monkeypatch, "leader", 8000)
+    a.event_log_dir = str(tmp_path / "events")
+    a.artifact_dir = str(tmp_path / "artifacts")
+    items = [
+        {
+            "host": "ansiblespawner-alice",
+            "hostvars": {"user": {"name": "alice"}, "port": 8000},
+            "event_handler": lambda e: True,
+        }
+    ]
+    await a._run_create_batch(items)
+    a._get_artifact_store().flush(10)
+    get_event_log_writer(a.event_log_dir, 10 * 1024 * 1024, 5).flush(10)
+
+    # Nothing with other users' variables is stored under the leader's key
+    assert os.listdir(a.event_log_dir) == ["ansiblespawner_batch.jsonl"]
+    store = a._get_artifact_store()
+    assert store.runs("leader") == []
+    assert store.runs("ansiblespawner_batch")[0]["operation"] == "create-batch"
@@ -0,0 +1,132 @@
+"""Unit tests for resumable start checkpoints"""
+
+import asyncio
+import pytest
+import time
+
+from ansiblespawner import AnsibleException
+
+
+@pytest.mark.asyncio
+async def test_start_resume(fake_ansible_spawner):
+    outputs = {
+        "create": {"ip": "127.0.0.1", "id": "i-1"},
+        "update": {"port": 8888},
+        "poll": {"running": True},
+    }
+    a, calls = fake_ansible_spawner(outputs, failures=("update",))
+    with pytest.raises(AnsibleException):
+        await a.start()
+    assert [c[0] for c in calls] == ["create", "update"]
+    assert a.checkpoint == {
+        "phases": ["create"],
+        "outputs": {"create": {"ip": "127.0.0.1", "id": "i-1"}},
+        "time": pytest.approx(time.time(), abs=10),
+    }
+    state = a.get_state()
+    assert state["checkpoint"] == a.checkpoint
+
+    # An incomplete start is reported as not running
+    assert await a.poll() == 0
+
+    b, calls = fake_ansible_spawner(outputs)
+    b.load_state(state)
+    assert await b.start() == ("127.0.0.1", 8888)
+    assert calls == [
+        ("poll", {"ip": "127.0.0.1", "id": "i-1"}),
+        ("update", {"ip": "127.0.0.1", "id": "i-1"}),
+    ]
+    assert b.checkpoint is None
+    assert "checkpoint" not in b.get_state()
+    assert b.serverinfo == {"ip": "127.0.0.1", "id": "i-1", "port": 8888}
+
+
+@pytest.mark.asyncio
+async def test_start_discard_checkpoint(fake_ansible_spawner):
+    outputs = {
+        "create": {"ip": "127.0.0.2", "port": 8000},
+        "update": {},
+        "poll": {"running": False},
+    }
+    a, calls = fake_ansible_spawner(outputs)
+    a.checkpoint = {
+        "phases": ["create"],
+        "outputs": {"create": {"ip": "old"}},
+        "time": time.time(),
+    }
+    assert await a.start() == ("127.0.0.2", 8000)
+    # Anything the incomplete start created is destroyed
+    assert calls[:2] == [("poll", {"ip": "old"}), ("destroy", {"ip": "old"})]
+    assert [c[0] for c in calls[2:]] == ["create", "update"]
+    assert calls[2][1] == {}
+    assert a.checkpoint is None
+
+
+@pytest.mark.asyncio
+async def test_start_expired_checkpoint(fake_ansible_spawner):
+    outputs = {"create": {"ip": "127.0.0.2", "port": 8000}, "update": {}}
+    a, calls = fake_ansible_spawner(outputs)
+    a.checkpoint_lifetime = 60
+    a.checkpoint = {
+        "phases": ["create"],
+        "outputs": {"create": {"ip": "old"}},
+        "time": time.time() - 120,
+    }
+    assert await a.start() == ("127.0.0.2", 8000)
+    assert [c[0] for c in calls] == ["destroy", "create", "update"]
+    assert a.checkpoint is None
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_expiry_timer(fake_ansible_spawner):
+    outputs = {"create": {"ip": "127.0.0.1", "id": "i-1"}}
+    a, calls = fake_ansible_spawner(outputs, failures=("update",))
+    a.checkpoint_lifetime = 1
+    with pytest.raises(AnsibleException):
+        await a.start()
+    assert a.checkpoint
+    a.checkpoint["time"] -= 0.9
+    # Reschedule with the earlier time
+    a.load_state(a.get_state())
+    await asyncio.sleep(0.5)
+    assert calls[-1] == ("destroy", {"ip": "127.0.0.1", "id": "i-1"})
+    assert not a.checkpoint
+    assert not a.serverinfo
+
+
+@pytest.mark.asyncio
+async def test_start_not_resumable(fake_ansible_spawner):
+    outputs = {"create": {"ip": "127.0.0.1", "port": 8000}, "update": {}}
+    a, calls = fake_ansible_spawner(outputs, failures=("update",))
+    a.resumable_start = False
+    with pytest.raises(AnsibleException):
+        await a.start()
+    assert not a.checkpoint
+    assert "checkpoint" not in a.get_state()
+
+
+@pytest.mark.asyncio
+async def test_load_stopped_checkpoint(fake_ansible_spawner, fake_restarted_hub):
+    def make_spawner():
+        a, calls = fake_ansible_spawner({})
+        a.checkpoint_lifetime = 60
+        return a, calls
+
+    created = fake_restarted_hub(
+        {
+            "": {
+                "serverinfo": {"id": "i-1"},
+                "checkpoint": {
+                    "phases": ["create"],
+                    "outputs": {"create": {"id": "i-1"}},
+                    "time": time.time() - 120,
+                },
+            },
+        },
+        make_spawner,
+    )
+    # The first spawner loaded after a restart loads incomplete starts
+    a, _ = make_spawner()
+    a.load_state({})
+    await asyncio.sleep(0.1)
+    assert created[""] == [("destroy", {"id": "i-1"})]
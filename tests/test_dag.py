@@ -0,0 +1,173 @@
+"""Unit tests for graphs of playbooks"""
+
+import asyncio
+import pytest
+import time
+from traitlets import TraitError
+
+from ansiblespawner import AnsibleException
+from ansiblespawner.dag import PlaybookDag, merge_outputs
+
+
+GRAPH = {
+    "instance": {"playbook": "instance.yml", "depends": ["volume", "secgroup"]},
+    "volume": "volume.yml",
+    "secgroup": {"playbook": "secgroup.yml"},
+}
+
+
+def test_order():
+    dag = PlaybookDag(GRAPH)
+    assert dag.order == ["volume", "secgroup", "instance"]
+    assert dag.playbooks["volume"] == "volume.yml"
+    assert dag.depends["instance"] == ["volume", "secgroup"]
+
+
+@pytest.mark.parametrize(
+    "spec,message",
+    [
+        ({}, "empty"),
+        ({"a": {"depends": []}}, "has no playbook"),
+        ({"a": {"playbook": "a.yml", "depends": ["b"]}}, "depends on b"),
+        (
+            {
+                "a": {"playbook": "a.yml", "depends": ["b"]},
+                "b": {"playbook": "b.yml", "depends": ["a"]},
+            },
+            "cycle",
+        ),
+    ],
+)
+def test_invalid(spec, message):
+    with pytest.raises(ValueError, match=message):
+        PlaybookDag(spec)
+
+
+@pytest.mark.asyncio
+async def test_run():
+    running = set()
+    concurrent = []
+
+    async def run_node(name, playbook, deps):
+        running.add(name)
+        await asyncio.sleep(0.1)
+        concurrent.append(set(running))
+        running.remove(name)
+        return {"ansiblespawner_out": {"name": name, name: deps}}
+
+    results = await PlaybookDag(GRAPH).run(run_node)
+    assert [name for name, _ in results] == ["volume", "secgroup", "instance"]
+    # volume and secgroup ran at the same time
+    assert {"volume", "secgroup"} in concurrent
+    assert merge_outputs(results) == {
+        "name": "instance",
+        "volume": {},
+        "secgroup": {},
+        "instance": {
+            "volume": {"name": "volume", "volume": {}},
+            "secgroup": {"name": "secgroup", "secgroup": {}},
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_run_failure():
+    started = []
+
+    async def run_node(name, playbook, deps):
+        started.append(name)
+        if name == "volume":
+            raise ValueError(name)
+        await asyncio.sleep(0.1)
+        return {}
+
+    with pytest.raises(ValueError, match="volume"):
+        await PlaybookDag(GRAPH).run(run_node)
+    # The running node finished but the dependent node was never started
+    assert started == ["volume", "secgroup"]
+
+
+@pytest.mark.asyncio
+async def test_start_graph(fake_ansible_spawner, monkeypatch):
+    a, calls = fake_ansible_spawner(
+        {
+            "create-volume": {"volume": "vol-1", "ip": "10.0.0.1"},
+            "create-secgroup": {"secgroup": "sg-1"},
+            "create-instance": {"ip": "10.0.0.2", "port": 8888},
+            "update-config": {"configured": True},
+        }
+    )
+    a.create_playbook = GRAPH
+    a.update_playbook = {"config": "config.yml"}
+    inventories = []
+    monkeypatch.setattr(
+        a,
+        "_render_inventory",
+        lambda args: inventories.append(args["serverinfo"]) or {},
+    )
+
+    assert await a.start() == ("10.0.0.2", 8888)
+    assert [op for op, _ in calls] == [
+        "create-volume",
+        "create-secgroup",
+        "create-instance",
+        "update-config",
+    ]
+    # Dependency outputs are merged into the node's serverinfo and inventory
+    instance = {"volume": "vol-1", "ip": "10.0.0.1", "secgroup": "sg-1"}
+    assert calls[2][1] == instance
+    assert inventories[3] == instance
+    assert a.serverinfo == {
+        "volume": "vol-1",
+        "secgroup": "sg-1",
+        "ip": "10.0.0.2",
+        "port": 8888,
+        "configured": True,
+    }
+
+
+@pytest.mark.asyncio
+async def test_start_graph_failure(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(
+        {"create-volume": {"volume": "vol-1"}}, failures=("create-secgroup",)
+    )
+    a.create_playbook = GRAPH
+
+    with pytest.raises(AnsibleException) as exc:
+        await a.start()
+    assert [op for op, _ in calls] == ["create-volume", "create-secgroup"]
+    assert [name for name, _ in exc.value.partial_results] == ["volume"]
+    # The volume can be found by destroy_playbook or a resumed start
+    assert a.serverinfo == {"volume": "vol-1"}
+    assert a.checkpoint == {
+        "phases": [],
+        "outputs": {},
+        "partial": {"create": {"volume": "vol-1"}},
+        "time": pytest.approx(time.time(), abs=10),
+    }
+    assert a.get_state()["serverinfo"] == {"volume": "vol-1"}
+
+    # A resumed start sees the partial outputs and reruns the graph
+    b, calls = fake_ansible_spawner(
+        {
+            "poll": {"running": True},
+            "create-instance": {"ip": "10.0.0.2", "port": 8888},
+        }
+    )
+    b.create_playbook = GRAPH
+    b.load_state(a.get_state())
+    await b.start()
+    assert calls[0] == ("poll", {"volume": "vol-1"})
+    assert [op for op, _ in calls[1:]] == [
+        "create-volume",
+        "create-secgroup",
+        "create-instance",
+        "update",
+    ]
+    assert not b.checkpoint
+
+
+def test_invalid_trait(fake_ansible_spawner):
+    a, _ = fake_ansible_spawner({})
+    with pytest.raises(TraitError, match="create_playbook: .*depends on b"):
+        a.create_playbook = {"a": {"playbook": "a.yml", "depends": ["b"]}}
@@ -0,0 +1,130 @@
+"""Unit tests for historical durations and progress estimates"""
+
+import json
+import os
+import pytest
+
+from ansiblespawner.durations import DurationStore, SpawnProgress
+
+
+def _events(start, tasks, stats, ident="run"):
+    """
+    start: Time of playbook_on_start
+    tasks: List of (task name, start time)
+    stats: Time of playbook_on_stats
+    ident: runner_ident of the playbook run
+    """
+
+    def created(t):
+        return f"2026-01-01T00:{t // 60:02d}:{t % 60:02d}.000000"
+
+    events = [{"event": "playbook_on_start", "created": created(start)}]
+    for name, t in tasks:
+        events.append(
+            {
+                "event": "playbook_on_task_start",
+                "created": created(t),
+                "event_data": {"task": name},
+            }
+        )
+    events.append({"event": "playbook_on_stats", "created": created(stats)})
+    for e in events:
+        e["runner_ident"] = ident
+    return events
+
+
+def test_duration_store(tmp_path):
+    path = str(tmp_path / "durations.json")
+    store = DurationStore(path, alpha=0.5)
+    assert store.get("create") is None
+    store.record("create", 10, [("a#0", 4)])
+    store.record("create", 20, [("a#0", 8), ("b#0", 2)])
+    expected = {
+        "mean": 15,
+        "count": 2,
+        "tasks": {"a#0": {"mean": 6, "count": 2}, "b#0": {"mean": 2, "count": 1}},
+    }
+    assert store.get("create") == expected
+
+    with open(path) as f:
+        assert json.load(f) == {"create": expected}
+    assert DurationStore(path).get("create") == expected
+
+
+def test_spawn_progress(tmp_path):
+    store = DurationStore(str(tmp_path / "durations.json"), alpha=1)
+    # 30s create (a: 10s, b: 20s), 10s update
+    for _ in range(2):
+        p = SpawnProgress(store, ["create", "update"], min_samples=2)
+        assert not p.known
+        p.start_phase("create")
+        events = _events(0, [("a", 0), ("b", 10)], 30)
+        for e in events:
+            assert p.event(e) is None
+        assert p.end_phase(events[-1]) is None
+        p.start_phase("update")
+        events = _events(0, [("c", 0)], 10)
+        for e in events:
+            p.event(e)
+        p.end_phase(events[-1])
+
+    p = SpawnProgress(store, ["create", "update"], min_samples=2, slow_factor=2)
+    assert p.known
+    p.start_phase("create")
+    estimates = [p.event(e) for e in _events(0, [("a", 0), ("b", 10)], 30)]
+    assert [e["progress"] for e in estimates] == [0, 0, 25, 75]
+    assert [e["eta"] for e in estimates] == [40, 40, 30, 10]
+    assert all(e["slow"] is None for e in estimates)
+
+    p.start_phase("update")
+    events = _events(0, [("c", 0)], 25)
+    estimates = [p.event(e) for e in events]
+    assert [e["progress"] for e in estimates] == [75, 75, 99]
+    assert estimates[-1]["slow"] == "update has taken 25s, usually 10s"
+    assert p.end_phase(events[-1]) == "update has taken 25s, usually 10s"
+
+
+def test_spawn_progress_concurrent_runs(tmp_path):
+    store = DurationStore(str(tmp_path / "durations.json"), alpha=1)
+    p = SpawnProgress(store, ["create"])
+    p.start_phase("create")
+    # A graph phase: volume (a: 0-5s) runs alongside instance (b: 0-20s)
+    volume = _events(0, [("a", 0)], 5, ident="volume")
+    instance = _events(0, [("b", 0)], 20, ident="instance")
+    for e in volume[:2] + instance[:2] + volume[2:] + instance[2:]:
+        p.event(e)
+    p.end_phase(instance[-1])
+    # The volume's stats event doesn't end the instance's task
+    assert store.get("create")["tasks"] == {
+        "a#0": {"mean": 5, "count": 1},
+        "b#0": {"mean": 20, "count": 1},
+    }
+
+
+@pytest.mark.asyncio
+async def test_start_progress(fake_ansible_spawner, tmp_path):
+    events = {
+        "create": _events(0, [("a", 0)], 20),
+        "update": _events(0, [("b", 0)], 20),
+    }
+    outputs = {"create": {"ip": "127.0.0.1", "port": 8888}, "update": {}}
+    for n in range(3):
+        a, calls = fake_ansible_spawner(outputs, events=events)
+        a.duration_store_path = str(tmp_path / "durations.json")
+        a.duration_min_samples = 2
+        await a.start()
+
+        messages = []
+        async for m in a.progress():
+            messages.append(m)
+        if n < 2:
+            assert all("progress" not in m for m in messages)
+        else:
+            assert [m["progress"] for m in messages] == [0, 0, 50, 50, 50, 99]
+            assert messages[0]["message"] == ("playbook_on_start (about 40s remaining)")
+
+    with open(os.path.join(tmp_path, "durations.json")) as f:
+        assert set(json.load(f)) == {
+            "create:" + os.path.abspath("create.yml"),
+            "update:" + os.path.abspath("update.yml"),
+        }
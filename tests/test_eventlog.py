@@ -0,0 +1,83 @@
+"""Unit tests for the structured event log"""
+
+import asyncio
+from collections import namedtuple
+import json
+import logging
+import os
+import pytest
+import yaml
+
+from ansiblespawner import AnsibleSpawner
+from ansiblespawner.eventlog import EventLogWriter, get_event_log_writer
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def _read_jsonl(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_event_log_writer(tmp_path):
+    writer = EventLogWriter(str(tmp_path), max_bytes=0, flush_interval=0.01)
+    writer.write("alice", {"n": 1})
+    writer.write("bob", {"n": 2})
+    writer.write("alice", {"n": 3})
+    writer.close(timeout=10)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["alice.jsonl", "bob.jsonl"]
+    assert _read_jsonl(tmp_path / "alice.jsonl") == [{"n": 1}, {"n": 3}]
+    assert _read_jsonl(tmp_path / "bob.jsonl") == [{"n": 2}]
+
+
+def test_event_log_writer_rotate(tmp_path):
+    writer = EventLogWriter(
+        str(tmp_path), max_bytes=20, backup_count=2, flush_interval=0.01
+    )
+    for n in range(5):
+        writer.write("alice", {"n": n, "padding": "x"})
+        writer.flush(timeout=10)
+    writer.close(timeout=10)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "alice.jsonl",
+        "alice.jsonl.1",
+        "alice.jsonl.2",
+    ]
+    assert _read_jsonl(tmp_path / "alice.jsonl") == [{"n": 4, "padding": "x"}]
+    assert _read_jsonl(tmp_path / "alice.jsonl.1") == [{"n": 3, "padding": "x"}]
+    assert _read_jsonl(tmp_path / "alice.jsonl.2") == [{"n": 2, "padding": "x"}]
+
+
+@pytest.mark.asyncio
+async def test_run_ansible_event_log(tmp_path):
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("user", "user")
+    a.event_log_dir = str(tmp_path)
+
+    with open(os.path.join(resources_dir, "unit_inventory.yml")) as f:
+        inventory = yaml.safe_load(f)
+    r = await a.run_ansible(
+        asyncio.get_running_loop(),
+        inventory=inventory,
+        playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+        operation="create",
+    )
+    r["tmpdir"].cleanup()
+
+    get_event_log_writer(
+        a.event_log_dir, a.event_log_max_bytes, a.event_log_backup_count
+    ).flush(timeout=10)
+    records = _read_jsonl(tmp_path / "user.jsonl")
+    assert {r["operation"] for r in records} == {"create"}
+    assert [r["event"]["event"] for r in records] == [e["event"] for e in r["events"]]
+
+
+def test_log_event_handler_disabled():
+    a = AnsibleSpawner()
+    a.log = logging.getLogger("test_log_event_handler_disabled")
+    a.log.setLevel(logging.INFO)
+    assert a._get_log_event_handler("poll") is None
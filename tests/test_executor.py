@@ -0,0 +1,212 @@
+"""Unit tests for remote Ansible executors"""
+
+import asyncio
+from collections import namedtuple
+import os
+import pytest
+import shutil
+import subprocess
+import yaml
+
+from ansiblespawner import AnsibleSpawner, AnsibleException, RemoteExecutor
+from ansiblespawner.worker import AnsibleWorker, WorkerError, server_ssl_context
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+SECRET = "test-secret"
+
+
+def _inventory():
+    with open(os.path.join(resources_dir, "unit_inventory.yml")) as f:
+        return yaml.safe_load(f)
+
+
+async def _start_worker(max_jobs=4):
+    worker = AnsibleWorker(SECRET, max_jobs=max_jobs)
+    server = await worker.start("127.0.0.1:0")
+    port = server.sockets[0].getsockname()[1]
+    return worker, server, f"127.0.0.1:{port}"
+
+
+def _spawner(workers, secret=SECRET):
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("user", "user")
+    a.executor = RemoteExecutor(workers=workers, secret=secret)
+    return a
+
+
+@pytest.mark.parametrize("inventory_dict", [True, False])
+@pytest.mark.asyncio
+async def test_remote_run_ansible(inventory_dict):
+    worker, server, address = await _start_worker()
+    a = _spawner([address])
+
+    inventory = _inventory()
+    if not inventory_dict:
+        inventory = ("inventory.yml", yaml.safe_dump(inventory))
+
+    events = []
+
+    def event_handler(e):
+        events.append(e["event"])
+        return True
+
+    try:
+        r = await a.run_ansible(
+            asyncio.get_running_loop(),
+            inventory=inventory,
+            playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+            extravars={"x": 1},
+            event_handler=event_handler,
+        )
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    r["tmpdir"].cleanup()
+    assert r["rc"] == 0
+    assert r["status"] == "successful"
+    assert r["stats"]["ok"] == {"localhost": 2}
+    assert [e["event"] for e in r["events"]] == events
+    assert events[0] == "playbook_on_start"
+    assert events[-1] == "playbook_on_stats"
+    assert worker.load == 0
+
+
+@pytest.mark.asyncio
+async def test_remote_run_ansible_failure():
+    worker, server, address = await _start_worker()
+    a = _spawner([address])
+    try:
+        with pytest.raises(AnsibleException) as exc:
+            await a.run_ansible(
+                asyncio.get_running_loop(),
+                inventory=_inventory(),
+                playbook=os.path.join(resources_dir, "unit_empty_playbook.yml"),
+            )
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert str(exc.value).startswith("AnsibleException: No successful tasks ")
+
+
+@pytest.mark.asyncio
+async def test_remote_authentication_failed():
+    worker, server, address = await _start_worker()
+    a = _spawner([address], secret="wrong")
+    try:
+        with pytest.raises(WorkerError) as exc:
+            await a.ansible_async(
+                asyncio.get_running_loop(),
+                inventory=_inventory(),
+                playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+            )
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert "Authentication failed" in str(exc.value)
+
+
+@pytest.mark.asyncio
+async def test_remote_worker_selection():
+    busy, busy_server, busy_address = await _start_worker(max_jobs=0)
+    free, free_server, free_address = await _start_worker()
+
+    executor = RemoteExecutor(workers=[busy_address, free_address], secret=SECRET)
+    executor._inflight[free_address] = 1
+    assert executor._candidates() == [busy_address, free_address]
+
+    try:
+        r = await executor.run(
+            asyncio.get_running_loop(),
+            inventory=_inventory(),
+            playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+        )
+        # Workers are ordered by the load they reported
+        assert executor._candidates() == [free_address, busy_address]
+    finally:
+        executor._inflight.clear()
+        executor._reported.clear()
+        for s in (busy_server, free_server):
+            s.close()
+            await s.wait_closed()
+    # The busy worker is skipped
+    assert r.status == "successful"
+
+
+@pytest.mark.asyncio
+async def test_remote_worker_slot_reserved():
+    worker, server, address = await _start_worker(max_jobs=1)
+    executor = RemoteExecutor(workers=[address], secret=SECRET)
+    try:
+        # A connection that is ready but hasn't sent its job holds the slot
+        reader, writer = await executor._connect(address)
+        assert worker.load == 1
+        with pytest.raises(WorkerError, match="busy"):
+            await executor._connect(address)
+        writer.close()
+        for _ in range(100):
+            if worker.load == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert worker.load == 0
+    finally:
+        executor._reported.clear()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_remote_requires_tls():
+    # Jobs contain users' API tokens so aren't sent over the network unencrypted
+    executor = RemoteExecutor(workers=["192.0.2.1:9736"], secret=SECRET)
+    with pytest.raises(WorkerError, match="TLS is required"):
+        await executor._connect("192.0.2.1:9736")
+    with pytest.raises(ValueError, match="TLS is required"):
+        await AnsibleWorker(SECRET).start("0.0.0.0:0")
+
+
+@pytest.mark.skipif(not shutil.which("openssl"), reason="openssl not found")
+@pytest.mark.asyncio
+async def test_remote_tls(tmp_path):
+    cert = str(tmp_path / "cert.pem")
+    key = str(tmp_path / "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=127.0.0.1",
+            "-addext",
+            "subjectAltName=IP:127.0.0.1",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    worker = AnsibleWorker(SECRET, ssl_context=server_ssl_context(cert, key))
+    server = await worker.start("127.0.0.1:0")
+    port = server.sockets[0].getsockname()[1]
+    executor = RemoteExecutor(
+        workers=[f"127.0.0.1:{port}"], secret=SECRET, ssl_ca_file=cert
+    )
+    try:
+        r = await executor.run(
+            asyncio.get_running_loop(),
+            inventory=_inventory(),
+            playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+        )
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert r.status == "successful"
@@ -0,0 +1,156 @@
+"""Unit tests for the spawner lifecycle state machine"""
+
+import asyncio
+import pytest
+
+from ansiblespawner import AnsibleException
+from ansiblespawner.lifecycle import Lifecycle
+
+
+OUTPUTS = {
+    "create": {"ip": "127.0.0.1", "port": 8888},
+    "update": {},
+    "poll": {"running": True},
+    "destroy": {},
+}
+
+
+async def _wait_for_state(a, state):
+    for _ in range(100):
+        if a.lifecycle.state == state:
+            return
+        await asyncio.sleep(0)
+    raise AssertionError(f"Lifecycle state is {a.lifecycle.state} not {state}")
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    lifecycle = Lifecycle()
+    runs = []
+
+    async def op(name):
+        runs.append(name)
+        await asyncio.sleep(0.05)
+        return name
+
+    results = await asyncio.gather(
+        lifecycle.run("a", op, "a1"),
+        lifecycle.run("a", op, "a2"),
+        lifecycle.run("b", op, "b"),
+    )
+    assert results == ["a1", "a1", "b"]
+    assert runs == ["a1", "b"]
+
+    # A completed operation runs again
+    assert await lifecycle.run("a", op, "a3") == "a3"
+
+
+@pytest.mark.asyncio
+async def test_serialized():
+    lifecycle = Lifecycle()
+    running = []
+    overlaps = []
+
+    async def op(name):
+        running.append(name)
+        overlaps.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(name)
+
+    await asyncio.gather(*[lifecycle.run(n, op, n) for n in ("a", "b", "c")])
+    assert overlaps == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller():
+    lifecycle = Lifecycle()
+
+    async def op():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.ensure_future(lifecycle.run("a", op))
+    second = asyncio.ensure_future(lifecycle.run("a", op))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+
+
+def test_invalid_state():
+    with pytest.raises(ValueError):
+        Lifecycle("unknown")
+
+
+@pytest.mark.asyncio
+async def test_poll_during_start(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(OUTPUTS)
+    assert a.lifecycle.state == "idle"
+    start = asyncio.ensure_future(a.start())
+    await _wait_for_state(a, "creating")
+    # Answered from the state, the poll playbook isn't run
+    assert await a.poll() is None
+    assert await start == ("127.0.0.1", 8888)
+    assert a.lifecycle.state == "running"
+    assert [c[0] for c in calls] == ["create", "update"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_polls_and_stops(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(OUTPUTS)
+    await a.start()
+    assert await asyncio.gather(a.poll(), a.poll()) == [None, None]
+    assert [c[0] for c in calls] == ["create", "update", "poll"]
+
+    stops = [asyncio.ensure_future(a.stop()) for _ in range(2)]
+    await _wait_for_state(a, "stopping")
+    assert await a.poll() == 0
+    await asyncio.gather(*stops)
+    assert a.lifecycle.state == "idle"
+    assert [c[0] for c in calls] == ["create", "update", "poll", "destroy"]
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_start(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(OUTPUTS)
+    start = asyncio.ensure_future(a.start())
+    await _wait_for_state(a, "creating")
+    await a.stop()
+    await start
+    # The server was destroyed after the start completed
+    assert [c[0] for c in calls] == ["create", "update", "destroy"]
+    assert a.lifecycle.state == "idle"
+
+
+@pytest.mark.asyncio
+async def test_failed_transitions(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(OUTPUTS, failures=("create",))
+    a.resumable_start = False
+    with pytest.raises(AnsibleException):
+        await a.start()
+    assert a.lifecycle.state == "idle"
+
+    a, calls = fake_ansible_spawner(OUTPUTS, failures=("destroy",))
+    await a.start()
+    with pytest.raises(AnsibleException):
+        await a.stop()
+    assert a.lifecycle.state == "running"
+
+
+def test_load_state(fake_ansible_spawner):
+    a, _ = fake_ansible_spawner(OUTPUTS)
+    a.load_state({"serverinfo": {"ip": "127.0.0.1", "port": 8888}})
+    assert a.lifecycle.state == "running"
+    a.load_state({"serverinfo": {"ip": "127.0.0.1"}, "suspended_at": 1.0})
+    assert a.lifecycle.state == "idle"
+
+
+@pytest.mark.asyncio
+async def test_destroy_during_suspend(fake_ansible_spawner):
+    a, calls = fake_ansible_spawner(dict(OUTPUTS, suspend={"state": "stopped"}))
+    a.suspend_playbook = "suspend.yml"
+    a.resume_playbook = "resume.yml"
+    await a.start()
+    await asyncio.gather(a.stop(), a.stop(now=True), a.stop())
+    assert [c[0] for c in calls] == ["create", "update", "suspend", "destroy"]
+    assert not a.suspended_at
+    assert a.lifecycle.state == "idle"
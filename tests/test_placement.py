@@ -0,0 +1,151 @@
+"""Unit tests for placing servers on a pool of hosts"""
+
+from collections import namedtuple
+import pytest
+import time
+
+from ansiblespawner import AnsibleException, PlacementError
+from ansiblespawner.placement import HostPool
+
+HOSTS = {
+    "small": {"capacity": {"cpu": 4, "memory": 8}, "vars": {"zone": "a"}},
+    "large": {"capacity": {"cpu": 16, "memory": 64}, "vars": {"zone": "b"}},
+}
+
+
+@pytest.mark.parametrize(
+    "policy,expected",
+    [
+        ("best-fit", ["small", "small", "large", "large"]),
+        ("first-fit", ["small", "small", "large", "large"]),
+        ("spread", ["large", "large", "large", "large"]),
+    ],
+)
+def test_host_pool_policies(policy, expected):
+    pool = HostPool(HOSTS, policy)
+    hosts = [pool.allocate(f"u{n}", {"cpu": 2, "memory": 4})["host"] for n in range(4)]
+    assert hosts == expected
+
+
+def test_host_pool_capacity():
+    pool = HostPool(HOSTS, "best-fit")
+    p = pool.allocate("u1", {"cpu": 16})
+    assert p == {"host": "large", "resources": {"cpu": 16}, "vars": {"zone": "b"}}
+    # Existing placements are returned
+    assert pool.allocate("u1", {"cpu": 1}) == p
+    assert pool.free("large") == {"cpu": 0, "memory": 64}
+
+    with pytest.raises(PlacementError):
+        pool.allocate("u2", {"cpu": 8})
+    # Unlimited resources, best-fit packs onto the fuller host
+    assert pool.allocate("u3", {"gpu": 1})["host"] == "large"
+
+    pool.release("u1")
+    assert pool.free("large") == {"cpu": 16, "memory": 64}
+    pool.restore("u1", p)
+    assert pool.placement("u1") == p
+    assert pool.free("large") == {"cpu": 0, "memory": 64}
+
+
+def test_host_pool_invalid_policy():
+    with pytest.raises(ValueError):
+        HostPool(HOSTS, "random")
+
+
+def _placed_spawner(factory, name, failures=()):
+    a, calls = factory(
+        {"create": {"ip": "127.0.0.1", "port": 8888}, "update": {}, "destroy": {}},
+        failures,
+    )
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User(name, name)
+    a.placement_hosts = {"h1": {"capacity": {"users": 1}}}
+    a.placement_request = lambda: {"users": 1}
+    return a, calls
+
+
+@pytest.mark.asyncio
+async def test_start_stop_placement(fake_ansible_spawner):
+    a, _ = _placed_spawner(fake_ansible_spawner, "alice")
+    await a.start()
+    assert a.placement == {"host": "h1", "resources": {"users": 1}, "vars": {}}
+    assert a.serverinfo["placement"] == a.placement
+    state = a.get_state()
+
+    b, _ = _placed_spawner(fake_ansible_spawner, "bob")
+    with pytest.raises(PlacementError):
+        await b.start()
+
+    # After a restart the placement is restored from the state
+    pool = a._get_host_pool()
+    pool.release("alice")
+    a.load_state(state)
+    assert pool.free("h1") == {"users": 0}
+
+    await a.stop()
+    assert not a.placement
+    assert "placement" not in a.serverinfo
+    assert pool.free("h1") == {"users": 1}
+    await b.start()
+    assert b.placement["host"] == "h1"
+    await b.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_start_releases_placement(fake_ansible_spawner):
+    a, _ = _placed_spawner(fake_ansible_spawner, "carol", failures=("create",))
+    a.resumable_start = False
+    with pytest.raises(AnsibleException):
+        await a.start()
+    assert a._get_host_pool().free("h1") == {"users": 1}
+    # Kept for the destroy_playbook
+    assert a.placement["host"] == "h1"
+    await a.stop()
+    assert not a.placement
+
+
+@pytest.mark.asyncio
+async def test_retry_after_slot_taken(fake_ansible_spawner):
+    a, _ = _placed_spawner(fake_ansible_spawner, "dave", failures=("create",))
+    a.resumable_start = False
+    with pytest.raises(AnsibleException):
+        await a.start()
+
+    b, _ = _placed_spawner(fake_ansible_spawner, "erin")
+    await b.start()
+    pool = b._get_host_pool()
+    assert pool.free("h1") == {"users": 0}
+
+    # The retry must not be placed on the full host
+    with pytest.raises(PlacementError):
+        await a.start()
+    assert pool.free("h1") == {"users": 0}
+    await b.stop()
+
+
+@pytest.mark.asyncio
+async def test_restore_stopped_placements(fake_ansible_spawner, fake_restarted_hub):
+    hosts = {"h2": {"capacity": {"users": 1}}}
+
+    def make_spawner(name):
+        a, calls = _placed_spawner(fake_ansible_spawner, name)
+        a.placement_hosts = hosts
+        return a, calls
+
+    # A suspended server holds the only slot
+    fake_restarted_hub(
+        {
+            "": {
+                "serverinfo": {
+                    "ip": "127.0.0.1",
+                    "placement": {"host": "h2", "resources": {"users": 1}},
+                },
+                "suspended_at": time.time(),
+            }
+        },
+        lambda: make_spawner("frank"),
+    )
+    a, _ = make_spawner("grace")
+    with pytest.raises(PlacementError):
+        await a.start()
+    assert a._get_host_pool().placement("frank")["host"] == "h2"
@@ -0,0 +1,117 @@
+"""Unit tests for cloud API rate limits"""
+
+import asyncio
+from collections import namedtuple
+import os
+import pytest
+import time
+import yaml
+
+from ansiblespawner import AnsibleSpawner, AnsibleException
+from ansiblespawner.ratelimit import (
+    THROTTLE_PATTERNS,
+    RateLimiter,
+    TokenBucket,
+    is_throttled,
+)
+
+
+resources_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    waits = [await bucket.acquire() for _ in range(4)]
+    elapsed = time.monotonic() - start
+    # The burst is admitted immediately, then one token every 0.05s
+    assert waits[:2] == [pytest.approx(0, abs=0.01)] * 2
+    assert 0.08 < elapsed < 0.5
+
+    # Costs larger than the burst wait for all their tokens
+    assert 0.3 < await bucket.acquire(10) < 1
+
+
+def test_token_bucket_adaptive():
+    bucket = TokenBucket(rate=10, burst=5, min_rate=2, increase=1)
+    bucket.throttled()
+    assert bucket.rate == 5
+    assert bucket.tokens == 0
+    bucket.throttled()
+    bucket.throttled()
+    assert bucket.rate == 2
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(
+        {"ec2": {"rate": 100, "burst": 3}, "iam": {"rate": 1, "burst": 1}}
+    )
+    # Unknown budgets aren't limited
+    assert await limiter.acquire({"ec2": 2, "other": 100}) < 0.01
+    assert limiter.buckets["ec2"].tokens == pytest.approx(1, abs=0.1)
+
+    limiter.report(["ec2"], throttled=True)
+    assert limiter.buckets["ec2"].rate == 50
+    assert limiter.buckets["iam"].rate == 1
+
+
+def test_is_throttled():
+    failed = {
+        "event": "runner_on_failed",
+        "event_data": {"res": {"msg": "Rate exceeded"}},
+    }
+    ok = {"event": "runner_on_ok", "event_data": {"res": {"msg": "Rate exceeded"}}}
+    other = {"event": "runner_on_failed", "stdout": "No such image"}
+    assert is_throttled([ok, failed], THROTTLE_PATTERNS)
+    assert not is_throttled([ok, other], THROTTLE_PATTERNS)
+    assert not is_throttled([failed], [])
+
+
+def test_rate_limit_costs():
+    a = AnsibleSpawner()
+    a.rate_limit_costs = {"create": {"ec2": 5}, "create-batch": {"ec2": 20}}
+    assert a._get_rate_limit_costs("create") == {}
+    a.rate_limits = {"ec2": {"rate": 1, "burst": 10}}
+    assert a._get_rate_limit_costs("create") == {"ec2": 5}
+    assert a._get_rate_limit_costs("create-batch") == {"ec2": 20}
+    assert a._get_rate_limit_costs("create-volume") == {"ec2": 5}
+    # Batches cost each server
+    assert a._get_rate_limit_costs("create-batch", 3) == {"ec2": 60}
+    assert a._get_rate_limit_costs("create", 3) == {"ec2": 15}
+    assert a._get_rate_limit_costs("poll") == {}
+    assert a._get_rate_limit_costs(None) == {}
+
+
+@pytest.mark.asyncio
+async def test_run_ansible_throttled():
+    a = AnsibleSpawner()
+    User = namedtuple("User", ["escaped_name", "name"])
+    a.user = User("user", "user")
+    a.rate_limits = {"throttle-test": {"rate": 4, "burst": 1}}
+    a.rate_limit_costs = {"create": {"throttle-test": 1}}
+    with open(os.path.join(resources_dir, "unit_inventory.yml")) as f:
+        inventory = yaml.safe_load(f)
+
+    with pytest.raises(AnsibleException):
+        await a.run_ansible(
+            asyncio.get_running_loop(),
+            inventory=inventory,
+            playbook=os.path.join(resources_dir, "unit_throttle_playbook.yml"),
+            operation="create",
+        )
+    bucket = a._get_rate_limiter().buckets["throttle-test"]
+    assert bucket.rate == 2
+
+    r = await a.run_ansible(
+        asyncio.get_running_loop(),
+        inventory=inventory,
+        playbook=os.path.join(resources_dir, "unit_playbook.yml"),
+        operation="create",
+    )
+    r["tmpdir"].cleanup()
+    assert bucket.rate == 2.4
@@ -0,0 +1,130 @@
+"""Unit tests for suspending and resuming servers"""
+
+import asyncio
+import pytest
+import time
+
+
+OUTPUTS = {
+    "create": {"ip": "127.0.0.1", "port": 8888, "id": "i-1"},
+    "update": {},
+    "suspend": {"state": "stopped"},
+    "resume": {"ip": "127.0.0.2", "state": "running"},
+    "destroy": {},
+}
+
+
+def _suspendable(factory, failures=()):
+    a, calls = factory(OUTPUTS, failures)
+    a.suspend_playbook = "suspend.yml"
+    a.resume_playbook = "resume.yml"
+    return a, calls
+
+
+@pytest.mark.asyncio
+async def test_suspend_resume(fake_ansible_spawner):
+    a, calls = _suspendable(fake_ansible_spawner)
+    await a.start()
+    await a.stop()
+    assert [c[0] for c in calls] == ["create", "update", "suspend"]
+    assert a.suspended_at
+    state = a.get_state()
+    assert state["serverinfo"]["state"] == "stopped"
+    assert state["suspended_at"] == a.suspended_at
+
+    # Suspended servers are not running
+    assert await a.poll() == 0
+
+    b, calls = _suspendable(fake_ansible_spawner)
+    b.load_state(state)
+    assert await b.start() == ("127.0.0.2", 8888)
+    assert [c[0] for c in calls] == ["resume", "update"]
+    assert b.serverinfo == {
+        "ip": "127.0.0.2",
+        "port": 8888,
+        "id": "i-1",
+        "state": "running",
+    }
+    assert not b.suspended_at
+    assert "suspended_at" not in b.get_state()
+
+
+@pytest.mark.asyncio
+async def test_stop_now_destroys(fake_ansible_spawner):
+    a, calls = _suspendable(fake_ansible_spawner)
+    await a.start()
+    await a.stop(now=True)
+    assert [c[0] for c in calls] == ["create", "update", "destroy"]
+    assert not a.suspended_at
+
+
+@pytest.mark.parametrize("expired", [True, False])
+@pytest.mark.asyncio
+async def test_resume_expired_or_failed(fake_ansible_spawner, expired):
+    a, calls = _suspendable(
+        fake_ansible_spawner, failures=() if expired else ("resume",)
+    )
+    # Suspended servers expire by default
+    a.serverinfo = {"ip": "127.0.0.9", "port": 8888}
+    a.suspended_at = time.time() - (8 * 24 * 3600 if expired else 0)
+
+    assert await a.start() == ("127.0.0.1", 8888)
+    expected = ["destroy", "create", "update"]
+    if not expired:
+        expected.insert(0, "resume")
+    assert [c[0] for c in calls] == expected
+    assert not a.suspended_at
+
+
+@pytest.mark.asyncio
+async def test_suspended_expiry_timer(fake_ansible_spawner):
+    a, calls = _suspendable(fake_ansible_spawner)
+    a.suspended_lifetime = 1
+    a.serverinfo = {"ip": "127.0.0.9", "port": 8888}
+    a.load_state(
+        {"serverinfo": a.serverinfo, "suspended_at": time.time() - 0.9},
+    )
+    await asyncio.sleep(0.5)
+    assert [c[0] for c in calls] == ["destroy"]
+    assert not a.suspended_at
+    assert not a.serverinfo
+
+
+@pytest.mark.asyncio
+async def test_replaced_spawner_timer(fake_ansible_spawner):
+    # JupyterHub discards a spawner after it stops and creates a new one
+    a, calls_a = _suspendable(fake_ansible_spawner)
+    a.suspended_lifetime = 1
+    await a.start()
+    await a.stop()
+
+    b, calls_b = _suspendable(fake_ansible_spawner)
+    b.suspended_lifetime = 1
+    b.load_state(a.get_state())
+    await b.start()
+    await asyncio.sleep(1.2)
+    # The old spawner's timer doesn't destroy the resumed server
+    assert [c[0] for c in calls_a] == ["create", "update", "suspend"]
+    assert [c[0] for c in calls_b] == ["resume", "update"]
+
+
+@pytest.mark.asyncio
+async def test_load_stopped_servers(fake_ansible_spawner, fake_restarted_hub):
+    created = fake_restarted_hub(
+        {
+            "": {
+                "serverinfo": {"ip": "127.0.0.9", "port": 8888},
+                "suspended_at": time.time() - 8 * 24 * 3600,
+            },
+            "stopped": {},
+        },
+        lambda: _suspendable(fake_ansible_spawner),
+    )
+
+    # After a restart JupyterHub only creates spawners for running servers,
+    # the first one loads the suspended servers so they expire
+    a, _ = _suspendable(fake_ansible_spawner)
+    a.load_state({"serverinfo": {"ip": "127.0.0.1", "port": 8888}})
+    await asyncio.sleep(0.1)
+    assert list(created) == [""]
+    assert [c[0] for c in created[""]] == ["destroy"]